@@ -2,31 +2,26 @@
 import streamlit as st
 import pandas as pd
 import matplotlib.pyplot as plt
-import json
 import hashlib
-import os
 import numpy as np
 
+from stockage import get_stockage
+from export_excel import Exports, demander_export_jeu
+import syntheses
+from doublons import IndexReponses, empreinte
+from noms_materiaux import IndexMateriaux, normaliser
+
 # -----------------------------
-# CONFIG / FICHIERS LOCAUX
+# STOCKAGE (fichiers locaux, SQLite ou serveur SQL : voir stockage.py)
 # -----------------------------
-USER_FILE = "users.json"
-LOCAL_DATA_FILE = "resultats.xlsx"
-
-# Création des fichiers locaux si nécessaires
-if not os.path.exists(USER_FILE):
-    with open(USER_FILE, "w", encoding="utf-8") as f:
-        json.dump({"utilisateurs": []}, f, indent=4, ensure_ascii=False)
-
-if not os.path.exists(LOCAL_DATA_FILE):
-    cols = ["NomUtilisateur", "AgeUtilisateur", "SexeUtilisateur",
+JEU = "materiaux"
+COLONNES = ["NomUtilisateur", "AgeUtilisateur", "SexeUtilisateur",
             "Materiau",
             "Res_Traction", "Durete", "Module_Elasticite",
             "pH", "Corrosivite", "Composition",
             "Conductivite", "Capacite_Calorifique", "Expansion",
             "Commentaire"]
-    df_init = pd.DataFrame(columns=cols)
-    df_init.to_excel(LOCAL_DATA_FILE, index=False)
+stockage = get_stockage()
 
 # -----------------------------
 # UTILITAIRES
@@ -34,21 +29,54 @@ if not os.path.exists(LOCAL_DATA_FILE):
 def hash_password(password: str) -> str:
     return hashlib.sha256(password.encode()).hexdigest()
 
-def load_users():
-    try:
-        with open(USER_FILE, "r", encoding="utf-8") as f:
-            return json.load(f).get("utilisateurs", [])
-    except:
-        return []
+def version_resultats():
+    # Change à chaque nouvelle réponse : sert de clé de cache
+    return stockage.version_reponses(JEU)
+
+@st.cache_data(max_entries=4)
+def lire_resultats(version):
+    # Réponses relues seulement quand elles ont changé
+    return stockage.lire_reponses(JEU, COLONNES)
+
+@st.cache_resource
+def index_commentaires(jeu):
+    # Index des commentaires du jeu, partagé par les sessions, complété au fil des réponses
+    return IndexReponses(cle="NomUtilisateur")
+
+def commentaire_doublon(jeu, commentaire):
+    index = index_commentaires(jeu).mettre_a_jour(lire_resultats(version_resultats()))
+    return index.chercher(commentaire)
 
-def save_users(users):
-    with open(USER_FILE, "w", encoding="utf-8") as f:
-        json.dump({"utilisateurs": users}, f, indent=4, ensure_ascii=False)
+@st.cache_resource
+def get_exports():
+    # Exports Excel sur un thread de fond par processus, partagés par les sessions
+    return Exports()
+
+def export_reponses():
+    # Export Excel des réponses préparé en arrière-plan, puis servi tant qu'elles ne changent pas
+    if st.sidebar.button("📤 Préparer l'export Excel"):
+        st.session_state["export_reponses"] = demander_export_jeu(get_exports(), JEU, stockage)
+    export = st.session_state.get("export_reponses")
+    if export is None:
+        return
+    if not export.done():
+        st.sidebar.info("⏳ Export Excel en cours…")
+        st.sidebar.button("Actualiser")
+    elif export.exception() is not None:
+        st.sidebar.error(f"Échec de l'export Excel : {export.exception()}")
+        st.session_state["export_reponses"] = None
+    else:
+        try:
+            with open(export.result(), "rb") as f:
+                st.sidebar.download_button("⬇ Télécharger les réponses (Excel)", data=f, file_name="reponses_materiaux.xlsx",
+                                           mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+        except OSError:
+            # remplacé entre-temps par un export plus récent
+            st.session_state["export_reponses"] = None
 
 def check_user_voted_local(username: str) -> bool:
     try:
-        df = pd.read_excel(LOCAL_DATA_FILE)
-        return username in df.get("NomUtilisateur", []).tolist()
+        return stockage.a_repondu(JEU, username, cle="NomUtilisateur")
     except:
         return False
 
@@ -83,10 +111,9 @@ def auth_page():
             email = st.text_input("Email", key="login_email")
             password = st.text_input("Mot de passe", type="password", key="login_pass")
             if st.button("Se connecter"):
-                users = load_users()
                 hashed = hash_password(password)
-                matched = next((u for u in users if u.get("email")==email and u.get("password")==hashed), None)
-                if matched:
+                matched = stockage.utilisateur(email)
+                if matched and matched.get("password")==hashed:
                     st.session_state["logged"] = True
                     st.session_state["user"] = matched.get("nom", email)
                     st.session_state["user_email"] = email
@@ -107,28 +134,29 @@ def auth_page():
                 if not nom or not email_r or not password_r:
                     st.error("Veuillez remplir tous les champs obligatoires.")
                 else:
-                    users = load_users()
-                    if any(u.get("email")==email_r for u in users):
+                    ajoute = stockage.ajouter_utilisateur({
+                        "nom": nom,
+                        "email": email_r,
+                        "age": int(age),
+                        "sexe": sexe,
+                        "password": hash_password(password_r)
+                    })
+                    if not ajoute:
                         st.error("Cet email est déjà utilisé.")
                     else:
-                        users.append({
-                            "nom": nom,
-                            "email": email_r,
-                            "age": int(age),
-                            "sexe": sexe,
-                            "password": hash_password(password_r)
-                        })
-                        save_users(users)
                         st.success("Inscription réussie ! Vous pouvez maintenant vous connecter.")
 
 # -----------------------------
 # RADAR CHART
 # -----------------------------
-def plot_radar_material(df_responses, materiau):
-    df_mat = df_responses[df_responses["Materiau"]==materiau]
-    if df_mat.empty:
+def plot_radar_material(stats, materiau):
+    # stats : synthèse par matériau indexée par clé normalisée (voir catalogue_materiaux)
+    cle = normaliser(materiau)
+    if cle not in stats.index:
         st.info(f"Aucune donnée pour le matériau '{materiau}'")
         return
+    ligne = stats.loc[cle]
+    materiau = ligne["Materiau"]
 
     categories = ["Res_Traction", "Durete", "Module_Elasticite",
                   "pH", "Corrosivite", "Composition",
@@ -138,20 +166,19 @@ def plot_radar_material(df_responses, materiau):
     angles = np.linspace(0, 2*np.pi, N, endpoint=False).tolist()
     angles += angles[:1]
 
+    def _valeurs(stat):
+        vals = [float(ligne[f"{c}_{stat}"]) if pd.notna(ligne[f"{c}_{stat}"]) else 0 for c in categories]
+        return vals + vals[:1]
+
     fig, ax = plt.subplots(figsize=(7,7), subplot_kw=dict(polar=True))
     ax.set_theta_offset(np.pi / 2)
     ax.set_theta_direction(-1)
 
-    # plot all responses faintly
-    for idx, row in df_mat.iterrows():
-        values = [float(row[c]) if pd.notna(row[c]) else 0 for c in categories]
-        values += values[:1]
-        ax.plot(angles, values, color='#888888', linewidth=0.8, alpha=0.25)
-        ax.fill(angles, values, color='#888888', alpha=0.05)
+    # étendue des réponses (min - max) en fond
+    ax.fill_between(angles, _valeurs("min"), _valeurs("max"), color='#888888', alpha=0.15, label='Min - max')
 
     # plot mean bold
-    mean_vals = [float(pd.to_numeric(df_mat[c], errors='coerce').mean()) for c in categories]
-    mean_vals += mean_vals[:1]
+    mean_vals = _valeurs("moy")
     ax.plot(angles, mean_vals, color='#1f77b4', linewidth=3, label='Moyenne')
     ax.fill(angles, mean_vals, color='#1f77b4', alpha=0.2)
 
@@ -160,15 +187,69 @@ def plot_radar_material(df_responses, materiau):
     ax.set_rlabel_position(0)
     ax.set_yticks([20,40,60,80,100])
     ax.set_ylim(0,100)
-    ax.set_title(f"Radar — {materiau}", size=14, pad=20)
+    ax.set_title(f"Radar — {materiau} ({int(ligne['n'])} réponses)", size=14, pad=20)
     ax.legend(loc='upper right', bbox_to_anchor=(1.3, 1.1))
     st.pyplot(fig)
+    plt.close(fig)
+
+@st.cache_resource
+def demarrer_syntheses():
+    # Tâche de matérialisation du processus : périodique + après chaque réponse
+    return syntheses.demarrer(stockage)
+
+@st.cache_data(max_entries=4)
+def lire_syntheses(version):
+    return syntheses.lire()
+
+@st.cache_data(max_entries=4)
+def stats_en_direct(version):
+    return syntheses.resumer_materiaux(lire_resultats(version))
+
+@st.cache_resource(max_entries=2)
+def construire_catalogue(version, _stats):
+    # Accès par clé normalisée + index de trigrammes, construits une fois par version
+    stats = _stats.set_index("Cle")
+    return stats, IndexMateriaux(stats["Materiau"], stats["n"])
+
+def catalogue_materiaux():
+    # Synthèse matérialisée, sinon calcul en direct sur les réponses
+    version = syntheses.version()
+    tables, horodatage = lire_syntheses(version)
+    if tables is not None and "Cle" in tables["materiaux"].columns:
+        stats, index = construire_catalogue(("synthese", version), tables["materiaux"])
+        return stats, index, f"Synthèse au {horodatage:%d/%m/%Y %H:%M:%S}"
+    version = version_resultats()
+    stats, index = construire_catalogue(("direct", version), stats_en_direct(version))
+    return stats, index, "Calcul en direct"
+
+# Le radar et sa saisie sont un fragment : taper un nom de matériau ne relance
+# ni le formulaire ni la lecture des synthèses
+fragment = getattr(st, "fragment", None) or st.experimental_fragment
+
+@fragment
+def section_radar():
+    st.subheader("📈 Visualisation de la tendace d'un matériau")
+    materiau_sel = st.text_input("Entrez le matériau à visualiser")
+    if materiau_sel.strip():
+        stats, index, source = catalogue_materiaux()
+        # "béton  c25" = "Béton C25" ; sinon, suggestions tolérantes aux fautes
+        materiau = index.resoudre(materiau_sel)
+        if materiau is None:
+            suggestions = [nom for nom, _ in index.suggerer(materiau_sel, k=8)]
+            if suggestions:
+                materiau = st.selectbox("Matériaux proches", suggestions, key="materiau_suggere")
+        if materiau is None:
+            st.info(f"Aucune donnée pour le matériau '{materiau_sel.strip()}'")
+        else:
+            plot_radar_material(stats, materiau)
+            st.caption(source)
 
 # -----------------------------
 # PAGE PRINCIPALE
 # -----------------------------
 def main():
     st.set_page_config(page_title="Sondage matériaux", layout="wide")
+    demarrer_syntheses()
     if not st.session_state.get("logged", False):
         auth_page()
         return
@@ -179,14 +260,10 @@ def main():
             if k in st.session_state: del st.session_state[k]
         st.success("Déconnecté. Veuillez vous reconnecter pour continuer.")
         return
+    export_reponses()
 
     st.title("📊 Sondage sur les propriétés d'un matériau au choix")
 
-    # charge réponses locales
-    try:
-        df_res = pd.read_excel(LOCAL_DATA_FILE)
-    except:
-        df_res = pd.DataFrame()
 
     # formulaire
     if st.session_state.get("voted", False):
@@ -214,36 +291,44 @@ def main():
             if not materiau.strip() or not commentaire.strip():
                 st.error("❌ Aucun champ ne doit être vide.")
             else:
-                users = load_users()
-                current_user = next((u for u in users if u.get("nom") == st.session_state["user"]), {})
-                age = current_user.get("age","")
-                sexe = current_user.get("sexe","")
-                new_row = pd.DataFrame([{
-                    "NomUtilisateur": st.session_state["user"],
-                    "AgeUtilisateur": age,
-                    "SexeUtilisateur": sexe,
-                    "Materiau": materiau,
-                    "Res_Traction": res_traction,
-                    "Durete": durete,
-                    "Module_Elasticite": module_elasticite,
-                    "pH": ph,
-                    "Corrosivite": corrosivite,
-                    "Composition": composition,
-                    "Conductivite": conductivite,
-                    "Capacite_Calorifique": capacite_calorifique,
-                    "Expansion": expansion,
-                    "Commentaire": commentaire
-                }])
-                df_res = pd.concat([df_res, new_row], ignore_index=True)
-                df_res.to_excel(LOCAL_DATA_FILE, index=False)
-                st.session_state["voted"] = True
-                st.success("✅ Réponse enregistrée !")
+                # Commentaire identique ou très proche d'une réponse existante : second envoi pour confirmer
+                dup = commentaire_doublon(JEU, commentaire)
+                cle_dup = (JEU, empreinte([commentaire]))
+                if dup is not None and st.session_state.get("doublon_confirme") != cle_dup:
+                    st.session_state["doublon_confirme"] = cle_dup
+                    proximite = "identique" if dup.type == "exact" else f"très proche ({dup.similarite:.0%})"
+                    st.warning(f"⚠ Ce commentaire est {proximite} d'une réponse déjà enregistrée. "
+                               "Cliquez à nouveau sur « Envoyer » pour confirmer.")
+                else:
+                    current_user = stockage.utilisateur(st.session_state.get("user_email","")) or {}
+                    age = current_user.get("age","")
+                    sexe = current_user.get("sexe","")
+                    new_row = {
+                        "NomUtilisateur": st.session_state["user"],
+                        "AgeUtilisateur": age,
+                        "SexeUtilisateur": sexe,
+                        "Materiau": materiau,
+                        "Res_Traction": res_traction,
+                        "Durete": durete,
+                        "Module_Elasticite": module_elasticite,
+                        "pH": ph,
+                        "Corrosivite": corrosivite,
+                        "Composition": composition,
+                        "Conductivite": conductivite,
+                        "Capacite_Calorifique": capacite_calorifique,
+                        "Expansion": expansion,
+                        "Commentaire": commentaire
+                    }
+                    # refusé par le stockage si une réponse existe déjà sous ce nom
+                    if stockage.ajouter_reponse(JEU, new_row, cle="NomUtilisateur"):
+                        syntheses.demander_materialisation()
+                        st.success("✅ Réponse enregistrée !")
+                    else:
+                        st.warning("❌ Vous avez déjà participé au sondage.")
+                    st.session_state["voted"] = True
 
     # radar chart : utilisateur peut choisir un matériau à visualiser
-    st.subheader("📈 Visualisation de la tendace d'un matériau")
-    materiau_sel = st.text_input("Entrez le matériau à visualiser")
-    if materiau_sel.strip():
-        plot_radar_material(df_res, materiau_sel.strip())
+    section_radar()
 
 if __name__ == "__main__":
     main()
@@ -2,32 +2,25 @@
 import streamlit as st
 import pandas as pd
 import matplotlib.pyplot as plt
-import json
 import hashlib
-import os
-import random
 import numpy as np
 
+from stockage import get_stockage
+from export_excel import Exports, demander_export_jeu
+import syntheses
+from doublons import IndexReponses, empreinte
+
 # -----------------------------
-# FICHIERS
+# STOCKAGE (fichiers locaux, SQLite ou serveur SQL : voir stockage.py)
 # -----------------------------
-USER_FILE = "users.json"
-DATA_FILE = "resultats.xlsx"
-
-# Création des fichiers si absents
-if not os.path.exists(USER_FILE):
-    with open(USER_FILE, "w", encoding="utf-8") as f:
-        json.dump({"utilisateurs": []}, f, indent=4, ensure_ascii=False)
-
-if not os.path.exists(DATA_FILE):
-    cols = ["NomUtilisateur", "AgeUtilisateur", "SexeUtilisateur",
+JEU = "materiaux"
+COLONNES = ["NomUtilisateur", "AgeUtilisateur", "SexeUtilisateur",
             "Materiau",
             "Res_Traction", "Durete", "Module_Elasticite",
             "pH", "Corrosivite", "Composition",
             "Conductivite", "Capacite_Calorifique", "Expansion",
             "Commentaire"]
-    df_init = pd.DataFrame(columns=cols)
-    df_init.to_excel(DATA_FILE, index=False)
+stockage = get_stockage()
 
 # -----------------------------
 # UTILITAIRES
@@ -35,23 +28,54 @@ if not os.path.exists(DATA_FILE):
 def hash_password(password: str) -> str:
     return hashlib.sha256(password.encode()).hexdigest()
 
-def load_users():
-    try:
-        with open(USER_FILE, "r", encoding="utf-8") as f:
-            return json.load(f).get("utilisateurs", [])
-    except:
-        return []
+def version_resultats():
+    # Change à chaque nouvelle réponse : sert de clé de cache
+    return stockage.version_reponses(JEU)
+
+@st.cache_data(max_entries=4)
+def lire_resultats(version):
+    # Réponses relues seulement quand elles ont changé
+    return stockage.lire_reponses(JEU, COLONNES)
 
-def save_users(users):
-    with open(USER_FILE, "w", encoding="utf-8") as f:
-        json.dump({"utilisateurs": users}, f, indent=4, ensure_ascii=False)
+@st.cache_resource
+def index_commentaires(jeu):
+    # Index des commentaires du jeu, partagé par les sessions, complété au fil des réponses
+    return IndexReponses(cle="NomUtilisateur")
+
+def commentaire_doublon(jeu, commentaire):
+    index = index_commentaires(jeu).mettre_a_jour(lire_resultats(version_resultats()))
+    return index.chercher(commentaire)
+
+@st.cache_resource
+def get_exports():
+    # Exports Excel sur un thread de fond par processus, partagés par les sessions
+    return Exports()
+
+def export_reponses():
+    # Export Excel des réponses préparé en arrière-plan, puis servi tant qu'elles ne changent pas
+    if st.sidebar.button("📤 Préparer l'export Excel"):
+        st.session_state["export_reponses"] = demander_export_jeu(get_exports(), JEU, stockage)
+    export = st.session_state.get("export_reponses")
+    if export is None:
+        return
+    if not export.done():
+        st.sidebar.info("⏳ Export Excel en cours…")
+        st.sidebar.button("Actualiser")
+    elif export.exception() is not None:
+        st.sidebar.error(f"Échec de l'export Excel : {export.exception()}")
+        st.session_state["export_reponses"] = None
+    else:
+        try:
+            with open(export.result(), "rb") as f:
+                st.sidebar.download_button("⬇ Télécharger les réponses (Excel)", data=f, file_name="reponses_materiaux.xlsx",
+                                           mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+        except OSError:
+            # remplacé entre-temps par un export plus récent
+            st.session_state["export_reponses"] = None
 
 def check_user_voted(username: str) -> bool:
-    if not os.path.exists(DATA_FILE):
-        return False
     try:
-        df = pd.read_excel(DATA_FILE)
-        return username in df.get("NomUtilisateur", []).tolist()
+        return stockage.a_repondu(JEU, username, cle="NomUtilisateur")
     except:
         return False
 
@@ -89,10 +113,9 @@ def auth_page():
             email = st.text_input("Email", key="login_email")
             password = st.text_input("Mot de passe", type="password", key="login_pass")
             if st.button("Se connecter"):
-                users = load_users()
                 hashed = hash_password(password)
-                matched = next((u for u in users if u.get("email")==email and u.get("password")==hashed), None)
-                if matched:
+                matched = stockage.utilisateur(email)
+                if matched and matched.get("password")==hashed:
                     st.session_state["logged"] = True
                     st.session_state["user"] = matched.get("nom", email)
                     st.session_state["user_email"] = email
@@ -113,18 +136,16 @@ def auth_page():
                 if not nom or not email_r or not password_r:
                     st.error("Veuillez remplir tous les champs obligatoires.")
                 else:
-                    users = load_users()
-                    if any(u.get("email")==email_r for u in users):
+                    ajoute = stockage.ajouter_utilisateur({
+                        "nom": nom,
+                        "email": email_r,
+                        "age": int(age),
+                        "sexe": sexe,
+                        "password": hash_password(password_r)
+                    })
+                    if not ajoute:
                         st.error("Cet email est déjà utilisé.")
                     else:
-                        users.append({
-                            "nom": nom,
-                            "email": email_r,
-                            "age": int(age),
-                            "sexe": sexe,
-                            "password": hash_password(password_r)
-                        })
-                        save_users(users)
                         st.success("Inscription réussie ! Vous pouvez maintenant vous connecter.")
 
 # -----------------------------
@@ -164,11 +185,30 @@ def plot_radar(user_row):
     ax.set_title(f"Évaluation des sous-propriétés — Matériau: {user_row['Materiau'].values[0]}", size=14, pad=20)
     ax.legend(loc='upper right', bbox_to_anchor=(1.3, 1.1))
     st.pyplot(fig)
+    plt.close(fig)
+
+# Fragment : le radar n'est pas redessiné à chaque interaction avec le formulaire
+fragment = getattr(st, "fragment", None) or st.experimental_fragment
+
+@fragment
+def section_radar():
+    try:
+        df_plot = lire_resultats(version_resultats())
+        user_rows = df_plot[df_plot["NomUtilisateur"]==st.session_state["user"]]
+        if not user_rows.empty:
+            plot_radar(user_rows.tail(1))
+    except Exception as e:
+        st.error(f"Erreur affichage graphique : {e}")
 
 # -----------------------------
 # PAGE PRINCIPALE
 # -----------------------------
+@st.cache_resource
+def demarrer_syntheses():
+    return syntheses.demarrer(stockage)
+
 def main():
+    demarrer_syntheses()
     if not st.session_state.get("logged", False):
         auth_page()
         return
@@ -178,13 +218,10 @@ def main():
         for k in ["logged","user","user_email","voted"]:
             if k in st.session_state: del st.session_state[k]
         return
+    export_reponses()
     
     st.title("📊 Sondage sur les propriétés d'un matériau")
     
-    try:
-        df_res = pd.read_excel(DATA_FILE)
-    except:
-        df_res = pd.DataFrame()
 
     if st.session_state.get("voted", False):
         st.warning("❌ Vous avez déjà répondu au sondage. Merci !")
@@ -217,43 +254,48 @@ def main():
             if not materiau.strip() or not commentaire.strip():
                 st.error("❌ Aucun champ ne doit être vide. Veuillez remplir tous les champs.")
             else:
-                users = load_users()
-                current_user = next((u for u in users if u.get("nom") == st.session_state["user"]), {})
-                age = current_user.get("age","")
-                sexe = current_user.get("sexe","")
-
-                new_row = pd.DataFrame({
-                    "NomUtilisateur":[st.session_state["user"]],
-                    "AgeUtilisateur":[age],
-                    "SexeUtilisateur":[sexe],
-                    "Materiau":[materiau],
-                    "Res_Traction":[res_traction],
-                    "Durete":[durete],
-                    "Module_Elasticite":[module_elasticite],
-                    "pH":[ph],
-                    "Corrosivite":[corrosivite],
-                    "Composition":[composition],
-                    "Conductivite":[conductivite],
-                    "Capacite_Calorifique":[capacite_calorifique],
-                    "Expansion":[expansion],
-                    "Commentaire":[commentaire]
-                })
+                # Commentaire identique ou très proche d'une réponse existante : second envoi pour confirmer
+                dup = commentaire_doublon(JEU, commentaire)
+                cle_dup = (JEU, empreinte([commentaire]))
+                if dup is not None and st.session_state.get("doublon_confirme") != cle_dup:
+                    st.session_state["doublon_confirme"] = cle_dup
+                    proximite = "identique" if dup.type == "exact" else f"très proche ({dup.similarite:.0%})"
+                    st.warning(f"⚠ Ce commentaire est {proximite} d'une réponse déjà enregistrée. "
+                               "Cliquez à nouveau sur « Envoyer » pour confirmer.")
+                else:
+                    current_user = stockage.utilisateur(st.session_state.get("user_email","")) or {}
+                    age = current_user.get("age","")
+                    sexe = current_user.get("sexe","")
 
-                df_res = pd.concat([df_res,new_row], ignore_index=True)
-                df_res.to_excel(DATA_FILE, index=False)
+                    new_row = {
+                        "NomUtilisateur": st.session_state["user"],
+                        "AgeUtilisateur": age,
+                        "SexeUtilisateur": sexe,
+                        "Materiau": materiau,
+                        "Res_Traction": res_traction,
+                        "Durete": durete,
+                        "Module_Elasticite": module_elasticite,
+                        "pH": ph,
+                        "Corrosivite": corrosivite,
+                        "Composition": composition,
+                        "Conductivite": conductivite,
+                        "Capacite_Calorifique": capacite_calorifique,
+                        "Expansion": expansion,
+                        "Commentaire": commentaire
+                    }
 
-                st.session_state["voted"] = True
-                st.success("✅ Réponse enregistrée !")
+                    # refusé par le stockage si une réponse existe déjà sous ce nom
+                    if stockage.ajouter_reponse(JEU, new_row, cle="NomUtilisateur"):
+                        # synthèses par matériau partagées avec GerardMbarga21P106.py
+                        syntheses.demander_materialisation()
+                        st.success("✅ Réponse enregistrée !")
+                    else:
+                        st.warning("❌ Vous avez déjà répondu au sondage. Merci !")
+                    st.session_state["voted"] = True
 
     # Radar chart
     if st.session_state.get("voted", False):
-        try:
-            df_plot = pd.read_excel(DATA_FILE)
-            user_rows = df_plot[df_plot["NomUtilisateur"]==st.session_state["user"]]
-            if not user_rows.empty:
-                plot_radar(user_rows.tail(1))
-        except Exception as e:
-            st.error(f"Erreur affichage graphique : {e}")
+        section_radar()
 
 # -----------------------------
 # EXECUTION
@@ -2,26 +2,26 @@
 import streamlit as st
 import pandas as pd
 import matplotlib.pyplot as plt
-import json
 import hashlib
-import os
 import random
+from io import BytesIO
+
+from stockage import get_stockage
+from export_excel import Exports, demander_export_jeu
+import syntheses
+from zones import jeu_zone, lister_zones
+from doublons import IndexReponses, empreinte
+from intervalles import NIVEAU, REPLIQUES, intervalles_parts
 
 
 # -----------------------------
-# FICHIERS
+# STOCKAGE (fichiers locaux, SQLite ou serveur SQL : voir stockage.py)
 # -----------------------------
-USER_FILE = "users.json"
-DATA_FILE = "resultats.xlsx"
-
-# Création des fichiers si absents
-if not os.path.exists(USER_FILE):
-    with open(USER_FILE, "w", encoding="utf-8") as f:
-        json.dump({"utilisateurs": []}, f, indent=4, ensure_ascii=False)
-
-if not os.path.exists(DATA_FILE):
-    df_init = pd.DataFrame(columns=["Nom", "Age", "Sexe", "Avis", "Commentaire"])
-    df_init.to_excel(DATA_FILE, index=False)
+# Une partition de réponses par zone (voir zones.py)
+ZONES = lister_zones()
+COLONNES = ["Nom", "Age", "Sexe", "Avis", "Commentaire"]
+OPTIONS_AVIS = ["Très bon","Bon","Moyen","Mauvais"]
+stockage = get_stockage()
 
 # -----------------------------
 # UTILITAIRES
@@ -29,26 +29,64 @@ if not os.path.exists(DATA_FILE):
 def hash_password(password: str) -> str:
     return hashlib.sha256(password.encode()).hexdigest()
 
-def load_users():
-    try:
-        with open(USER_FILE, "r", encoding="utf-8") as f:
-            return json.load(f).get("utilisateurs", [])
-    except:
-        return []
+def version_resultats(zone):
+    # Change à chaque nouvelle réponse dans la zone : sert de clé de cache
+    return stockage.version_reponses(jeu_zone(zone))
 
-def save_users(users):
-    with open(USER_FILE, "w", encoding="utf-8") as f:
-        json.dump({"utilisateurs": users}, f, indent=4, ensure_ascii=False)
+@st.cache_data(max_entries=64)
+def lire_resultats(zone, version):
+    # Réponses de la seule partition de la zone, relues quand elles ont changé
+    return stockage.lire_reponses(jeu_zone(zone), COLONNES)
 
-def check_user_voted(username: str) -> bool:
-    if not os.path.exists(DATA_FILE):
-        return False
+def check_user_voted(username: str, zone) -> bool:
     try:
-        df = pd.read_excel(DATA_FILE)
-        return username in df.get("Nom", []).tolist()
+        return stockage.a_repondu(jeu_zone(zone), username)
     except:
         return False
 
+@st.cache_resource
+def index_commentaires(zone):
+    # Index des commentaires de la zone, partagé par les sessions, complété au fil des réponses
+    return IndexReponses(cle="Nom")
+
+def commentaire_doublon(zone, commentaire):
+    index = index_commentaires(zone).mettre_a_jour(lire_resultats(zone, version_resultats(zone)))
+    return index.chercher(commentaire)
+
+@st.cache_resource
+def get_exports():
+    # Exports Excel sur un thread de fond par processus, partagés par les sessions
+    return Exports()
+
+def export_reponses(zone):
+    # Export Excel des réponses préparé en arrière-plan, puis servi tant qu'elles ne changent pas
+    if st.sidebar.button("📤 Préparer l'export Excel"):
+        st.session_state["export_reponses"] = (zone, demander_export_jeu(get_exports(), "avis", stockage, zone=zone))
+    zone_export, export = st.session_state.get("export_reponses") or (None, None)
+    if export is None or zone_export != zone:
+        return
+    if not export.done():
+        st.sidebar.info("⏳ Export Excel en cours…")
+        st.sidebar.button("Actualiser")
+    elif export.exception() is not None:
+        st.sidebar.error(f"Échec de l'export Excel : {export.exception()}")
+        st.session_state["export_reponses"] = None
+    else:
+        try:
+            with open(export.result(), "rb") as f:
+                st.sidebar.download_button("⬇ Télécharger les réponses (Excel)", data=f, file_name=f"reponses_{zone}.xlsx",
+                                           mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+        except OSError:
+            # remplacé entre-temps par un export plus récent
+            st.session_state["export_reponses"] = None
+
+def a_vote(zone):
+    # Vote de l'utilisateur dans la zone, vérifié une fois par session et par zone
+    votes = st.session_state["votes_zones"]
+    if zone not in votes:
+        votes[zone] = check_user_voted(st.session_state.get("user",""), zone)
+    return votes[zone]
+
 # -----------------------------
 # SESSION : initialisation sûre
 # -----------------------------
@@ -56,7 +94,7 @@ session_keys_defaults = {
     "logged": False,
     "user": "",
     "user_email": "",
-    "voted": False,
+    "votes_zones": {},
     "reset_step": None,
     "reset_code": None,
     "reset_email_val": None
@@ -88,18 +126,13 @@ def auth_page():
             email = st.text_input("Email", key="login_email")
             password = st.text_input("Mot de passe", type="password", key="login_pass")
             if st.button("Se connecter"):
-                users = load_users()
                 hashed = hash_password(password)
-                matched = None
-                for u in users:
-                    if u.get("email") == email and u.get("password") == hashed:
-                        matched = u
-                        break
-                if matched:
+                matched = stockage.utilisateur(email)
+                if matched and matched.get("password") == hashed:
                     st.session_state["logged"] = True
                     st.session_state["user"] = matched.get("nom", email)
                     st.session_state["user_email"] = email
-                    st.session_state["voted"] = check_user_voted(st.session_state.get("user",""))
+                    st.session_state["votes_zones"] = {}
                     st.success(f"Connexion réussie — bienvenue {st.session_state['user']} !")
                 else:
                     st.error("Email ou mot de passe incorrect.")
@@ -116,18 +149,16 @@ def auth_page():
                 if not nom or not email_r or not password_r:
                     st.error("Veuillez remplir tous les champs obligatoires.")
                 else:
-                    users = load_users()
-                    if any(u.get("email") == email_r for u in users):
+                    ajoute = stockage.ajouter_utilisateur({
+                        "nom": nom,
+                        "email": email_r,
+                        "age": int(age),
+                        "sexe": sexe,
+                        "password": hash_password(password_r)
+                    })
+                    if not ajoute:
                         st.error("Cet email est déjà utilisé.")
                     else:
-                        users.append({
-                            "nom": nom,
-                            "email": email_r,
-                            "age": int(age),
-                            "sexe": sexe,
-                            "password": hash_password(password_r)
-                        })
-                        save_users(users)
                         st.success("Inscription réussie ! Vous pouvez maintenant vous connecter.")
 
         # Mot de passe oublié
@@ -140,8 +171,7 @@ def auth_page():
             if st.session_state["reset_step"] == "email":
                 rp_email = st.text_input("Entrez votre email", key="reset_email_input")
                 if st.button("Envoyer code"):
-                    users = load_users()
-                    if any(u.get("email") == rp_email for u in users):
+                    if stockage.utilisateur(rp_email):
                         code = str(random.randint(100000,999999))
                         st.session_state["reset_email_val"] = rp_email
                         st.session_state["reset_code"] = code
@@ -171,22 +201,144 @@ def auth_page():
                     elif new_pass != confirm_pass:
                         st.error("Les mots de passe ne correspondent pas.")
                     else:
-                        users = load_users()
                         email_to_change = st.session_state.get("reset_email_val")
-                        for u in users:
-                            if u.get("email") == email_to_change:
-                                u["password"] = hash_password(new_pass)
-                                save_users(users)
-                                st.success("Mot de passe réinitialisé avec succès !")
-                                st.session_state["reset_step"] = None
-                                st.session_state["reset_code"] = None
-                                st.session_state["reset_email_val"] = None
-                                break
+                        if stockage.modifier_mot_de_passe(email_to_change, hash_password(new_pass)):
+                            st.success("Mot de passe réinitialisé avec succès !")
+                            st.session_state["reset_step"] = None
+                            st.session_state["reset_code"] = None
+                            st.session_state["reset_email_val"] = None
+
+# -----------------------------
+# DIAGRAMME (fragment : ne suit pas les reruns du formulaire)
+# -----------------------------
+fragment = getattr(st, "fragment", None) or st.experimental_fragment
+
+@st.cache_resource
+def demarrer_syntheses():
+    # Tâche de matérialisation du processus : périodique + après chaque réponse
+    return syntheses.demarrer(stockage)
+
+@st.cache_data(max_entries=4)
+def lire_syntheses(version):
+    return syntheses.lire()
+
+def votes_en_direct(zone, resumer):
+    # Sans synthèse : agrégat de chaque partition concernée (toutes si zone=None)
+    zones = ZONES if zone is None else [zone]
+    return pd.concat([resumer(lire_resultats(z, version_resultats(z))).assign(Zone=z) for z in zones],
+                     ignore_index=True)
+
+def comptes_avis(zone):
+    # Votes par avis d'une zone (ou cumul des zones) : synthèse matérialisée, sinon calcul en direct
+    tables, horodatage = lire_syntheses(syntheses.version())
+    if tables is not None and "Zone" in tables["votes_avis"].columns:
+        votes, source = tables["votes_avis"], f"Synthèse au {horodatage:%d/%m/%Y %H:%M:%S}"
+    else:
+        votes, source = votes_en_direct(zone, syntheses.resumer_votes), "Calcul en direct"
+    votes = syntheses.cumul_zones(votes, zone)
+    if votes.empty:
+        return None, None
+    return votes.set_index("Avis")["n"], source
+
+@st.cache_data(max_entries=4)
+def figure_tendance(counts):
+    fig, ax = plt.subplots()
+    colors = ['#A3C1AD','#FFDAB9','#FFE4E1','#B0C4DE']
+    ax.pie(counts, labels=counts.index, autopct='%1.1f%%', startangle=90, colors=colors)
+    ax.axis('equal')
+    buf = BytesIO()
+    fig.savefig(buf, format="png", bbox_inches="tight")
+    plt.close(fig)
+    return buf.getvalue()
+
+# Segments démographiques : colonnes de la synthèse "votes_segments"
+SEGMENTS = {"Ensemble": [], "Sexe": ["Sexe"], "Tranche d'âge": ["Tranche_age"],
+            "Sexe et âge": ["Sexe", "Tranche_age"]}
+
+def votes_segments(zone):
+    tables, horodatage = lire_syntheses(syntheses.version())
+    if tables is not None and "Zone" in tables.get("votes_segments", pd.DataFrame()).columns:
+        votes, source = tables["votes_segments"], f"Synthèse au {horodatage:%d/%m/%Y %H:%M:%S}"
+    else:
+        votes, source = votes_en_direct(zone, syntheses.resumer_votes_segments), "Calcul en direct"
+    return syntheses.cumul_zones(votes, zone, cles=("Sexe", "Tranche_age", "Avis")), source
+
+@st.cache_data(max_entries=16)
+def parts_avis(votes, segment, methode):
+    # Comptes segment x avis, puis parts et intervalles (Wilson ou bootstrap groupé)
+    cles = SEGMENTS[segment]
+    if cles:
+        comptes = votes.pivot_table(index=cles, columns="Avis", values="n", aggfunc="sum", fill_value=0)
+        if len(cles) > 1:
+            comptes.index = [" / ".join(map(str, i)) for i in comptes.index]
+    else:
+        comptes = votes.groupby("Avis")["n"].sum().to_frame("Ensemble").T
+    comptes = comptes.reindex(columns=OPTIONS_AVIS, fill_value=0)
+    comptes.index.name, comptes.columns.name = "Segment", "Avis"
+    return intervalles_parts(comptes, methode=methode.lower())
+
+@st.cache_data(max_entries=16)
+def figure_intervalles(parts):
+    segments = parts["Segment"].unique().tolist()
+    fig, ax = plt.subplots(figsize=(7, 1 + 0.6 * len(segments) * len(OPTIONS_AVIS) / 2))
+    colors = ['#A3C1AD','#FFDAB9','#FFE4E1','#B0C4DE']
+    for j, (option, color) in enumerate(zip(OPTIONS_AVIS, colors)):
+        sel = parts[parts["Avis"] == option]
+        y = [segments.index(seg) + (j - 1.5) * 0.18 for seg in sel["Segment"]]
+        err = [(sel["part"] - sel["bas"]).clip(lower=0), (sel["haut"] - sel["part"]).clip(lower=0)]
+        ax.errorbar(sel["part"], y, xerr=err, fmt="o", color=color, ecolor="#555555", capsize=3, label=option)
+    ax.set_yticks(range(len(segments)))
+    ax.set_yticklabels(segments)
+    ax.invert_yaxis()
+    ax.set_xlim(0, 1)
+    ax.xaxis.set_major_formatter(lambda x, _: f"{x:.0%}")
+    ax.legend(loc="lower right", fontsize=8)
+    buf = BytesIO()
+    fig.savefig(buf, format="png", bbox_inches="tight")
+    plt.close(fig)
+    return buf.getvalue()
+
+def afficher_intervalles(zone):
+    c_seg, c_meth = st.columns(2)
+    segment = c_seg.selectbox("Segment", list(SEGMENTS), key="ic_segment")
+    methode = c_meth.radio("Méthode", ["Wilson", "Bootstrap"], horizontal=True, key="ic_methode")
+    votes, source = votes_segments(zone)
+    if votes.empty:
+        st.info("Aucune donnée pour le moment.")
+        return
+    parts = parts_avis(votes, segment, methode)
+    st.image(figure_intervalles(parts))
+    ic = f"IC {NIVEAU:.0%}"
+    st.dataframe(pd.DataFrame({
+        "Segment": parts["Segment"],
+        "Avis": parts["Avis"],
+        "Votes": parts["n"],
+        "Part": parts["part"].map(lambda v: f"{v:.1%}" if pd.notna(v) else "—"),
+        ic: [f"[{b:.1%} ; {h:.1%}]" if pd.notna(b) else "—" for b, h in zip(parts["bas"], parts["haut"])],
+    }), hide_index=True)
+    detail = f"bootstrap multinomial, {REPLIQUES} répliques" if methode == "Bootstrap" else "intervalles de Wilson"
+    st.caption(f"{source} — {detail}")
+
+@fragment
+def afficher_tendance(zone):
+    st.subheader("📈 Aperçu de la tendance")
+    portee = st.radio("Portée", [f"Zone de {zone}", "Toutes les zones"], horizontal=True, key="portee_tendance")
+    if portee == "Toutes les zones":
+        zone = None
+    counts, source = comptes_avis(zone)
+    if counts is None or counts.empty:
+        st.info("Aucune donnée pour le moment.")
+    else:
+        st.image(figure_tendance(counts))
+        st.caption(source)
+        with st.expander("Parts et intervalles de confiance"):
+            afficher_intervalles(zone)
 
 # -----------------------------
 # PAGE PRINCIPALE (sondage)
 # -----------------------------
 def main():
+    demarrer_syntheses()
     if not st.session_state.get("logged", False):
         auth_page()
         return
@@ -194,27 +346,25 @@ def main():
     # Déconnexion
     st.sidebar.markdown("---")
     if st.sidebar.button("🔓 Déconnexion"):
-        for k in ["logged","user","user_email","voted"]:
+        for k in ["logged","user","user_email","votes_zones"]:
             if k in st.session_state:
                 del st.session_state[k]
         return
 
-    # Sondage
-    zone = "Ngoulemakong"
+    # Sondage : zone choisie dans la barre latérale ou par le lien (?zone=...)
+    demandee = st.query_params.get("zone")
+    zone = st.sidebar.selectbox("Zone du sondage", ZONES, index=ZONES.index(demandee) if demandee in ZONES else 0)
+    st.query_params["zone"] = zone
+    export_reponses(zone)
     st.title(f"📊 Sondage sur le rendu suite à l'achèvement des travaux dans la zone de {zone}")
 
-    try:
-        df_res = pd.read_excel(DATA_FILE)
-    except:
-        df_res = pd.DataFrame(columns=["Nom","Age","Sexe","Avis","Commentaire"])
-
-    if st.session_state.get("voted", False):
+    if a_vote(zone):
         st.subheader(f"Heureux de vous revoir {st.session_state.get('user','')} !")
         st.warning("❌ Vous avez déjà répondu au sondage. Merci !")
     else:
         st.subheader(f"Bienvenue {st.session_state.get('user','')} !")
         with st.form("form_sondage"):
-            avis = st.selectbox("Votre avis :", ["Très bon","Bon","Moyen","Mauvais"])
+            avis = st.selectbox("Votre avis :", OPTIONS_AVIS)
             commentaire = st.text_area("Commentaire")
             submit = st.form_submit_button("Envoyer")
 
@@ -222,38 +372,35 @@ def main():
             if not avis or not commentaire.strip():
                 st.error("Veuillez remplir tous les champs.")
             else:
-                users = load_users()
-                current_user = next((u for u in users if u.get("nom") == st.session_state.get("user","")), {})
-                age = current_user.get("age","")
-                sexe = current_user.get("sexe","")
-                new_row = pd.DataFrame({
-                    "Nom":[st.session_state.get("user","")],
-                    "Age":[age],
-                    "Sexe":[sexe],
-                    "Avis":[avis],
-                    "Commentaire":[commentaire]
-                })
-                df_res = pd.concat([df_res,new_row], ignore_index=True)
-                df_res.to_excel(DATA_FILE, index=False)
-                st.session_state["voted"] = True
-                st.success("✅ Réponse enregistrée ! Le formulaire n'est plus accessible.")
+                # Commentaire identique ou très proche d'une réponse existante : second envoi pour confirmer
+                dup = commentaire_doublon(zone, commentaire)
+                cle_dup = (zone, empreinte([commentaire]))
+                if dup is not None and st.session_state.get("doublon_confirme") != cle_dup:
+                    st.session_state["doublon_confirme"] = cle_dup
+                    proximite = "identique" if dup.type == "exact" else f"très proche ({dup.similarite:.0%})"
+                    st.warning(f"⚠ Ce commentaire est {proximite} d'une réponse déjà enregistrée. "
+                               "Cliquez à nouveau sur « Envoyer » pour confirmer.")
+                else:
+                    current_user = stockage.utilisateur(st.session_state.get("user_email","")) or {}
+                    age = current_user.get("age","")
+                    sexe = current_user.get("sexe","")
+                    new_row = {
+                        "Nom": st.session_state.get("user",""),
+                        "Age": age,
+                        "Sexe": sexe,
+                        "Avis": avis,
+                        "Commentaire": commentaire
+                    }
+                    # refusé par le stockage si une réponse existe déjà sous ce nom
+                    if stockage.ajouter_reponse(jeu_zone(zone), new_row):
+                        syntheses.demander_materialisation()
+                        st.success("✅ Réponse enregistrée ! Le formulaire n'est plus accessible.")
+                    else:
+                        st.warning("❌ Vous avez déjà répondu au sondage. Merci !")
+                    st.session_state["votes_zones"][zone] = True
 
     # Diagramme
-    st.subheader("📈 Aperçu de la tendance")
-    try:
-        df_plot = pd.read_excel(DATA_FILE)
-    except:
-        df_plot = pd.DataFrame(columns=["Nom","Age","Sexe","Avis","Commentaire"])
-
-    if df_plot.empty or "Avis" not in df_plot.columns:
-        st.info("Aucune donnée pour le moment.")
-    else:
-        counts = df_plot["Avis"].value_counts()
-        fig, ax = plt.subplots()
-        colors = ['#A3C1AD','#FFDAB9','#FFE4E1','#B0C4DE']
-        ax.pie(counts, labels=counts.index, autopct='%1.1f%%', startangle=90, colors=colors)
-        ax.axis('equal')
-        st.pyplot(fig)
+    afficher_tendance(zone)
 
 # -----------------------------
 # EXECUTION
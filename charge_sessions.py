@@ -0,0 +1,331 @@
+# charge_sessions.py
+# Banc de charge : N sessions Streamlit simultanées (sans navigateur, sans réseau)
+# pour chaque application, avec un mélange réaliste connexion / inscription /
+# soumission / lecture du tableau de bord.
+#
+# Par défaut les sessions tournent sur des threads d'un même processus, comme
+# sur un serveur Streamlit : elles partagent cache_resource (Evaluations,
+# stockage) et ses verrous. --mode processus isole chaque session dans son
+# propre processus (contention limitée au stockage).
+#
+#   python charge_sessions.py --sessions 20 --iterations 5
+#   python charge_sessions.py --sessions 20 --mode processus
+#   python charge_sessions.py --apps ponts --sessions 50 --json rapport.json
+#   python charge_sessions.py --apps ponts --sessions 50 --stockage sqlite:///charge.db
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# -----------------------------
+# CONFIG
+# -----------------------------
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+APPS = {
+    "sondage": "21P106.py",
+    "materiaux": "GerardMbarga21P106.py",
+    "ponts": "NgoumtsaAnge_23P481",
+}
+
+# Jeu de réponses (stockage.py) écrit par chaque application de sondage
+JEUX = {"sondage": "avis", "materiaux": "materiaux"}
+
+# Mélange d'opérations par itération d'une session (poids relatifs)
+MIX_DEFAUT = {"lecture": 6, "soumission": 2, "connexion": 2}
+
+MODES = ("threads", "processus")
+
+
+# -----------------------------
+# OUTILS APPTEST
+# -----------------------------
+def _nouvelle_session(app, timeout):
+    from streamlit.testing.v1 import AppTest
+    at = AppTest.from_file(os.path.join(BASE_DIR, APPS[app]), default_timeout=timeout)
+    return at
+
+def _bouton(at, libelle):
+    return next(b for b in at.button if b.label == libelle)
+
+def _par_libelle(widgets, libelle):
+    return next(w for w in widgets if w.label == libelle)
+
+def _succes(at, fragment):
+    return any(fragment in str(m.value) for m in at.success)
+
+def _chronometre(mesures, op, fn):
+    # None = opération sans objet (ex. déjà voté), compté comme réussi
+    t0 = time.perf_counter()
+    try:
+        resultat = fn()
+    except Exception:
+        resultat = False
+    mesures.append((op, time.perf_counter() - t0, resultat is not False))
+    return resultat
+
+
+# -----------------------------
+# SCÉNARIOS PAR APPLICATION
+# -----------------------------
+def _inscription(at, compte):
+    at.text_input(key="reg_nom").input(compte["nom"])
+    at.number_input(key="reg_age").set_value(compte["age"])
+    at.selectbox(key="reg_sexe").select(compte["sexe"])
+    at.text_input(key="reg_email").input(compte["email"])
+    at.text_input(key="reg_pass").input(compte["password"])
+    _bouton(at, "S'inscrire").click().run()
+    return _succes(at, "Inscription réussie")
+
+def _connexion(at, compte):
+    if at.session_state["logged"]:
+        # on repasse par la page d'authentification
+        _bouton(at, "🔓 Déconnexion").click().run()
+        at.run()
+    at.text_input(key="login_email").input(compte["email"])
+    at.text_input(key="login_pass").input(compte["password"])
+    _bouton(at, "Se connecter").click().run()
+    at.run()
+    return at.session_state["logged"]
+
+def _soumission_sondage(at, compte, rng):
+    # formulaire absent : déjà voté dans la zone affichée
+    if not any(w.label == "Votre avis :" for w in at.selectbox):
+        return None
+    _par_libelle(at.selectbox, "Votre avis :").select(rng.choice(["Très bon", "Bon", "Moyen", "Mauvais"]))
+    _par_libelle(at.text_area, "Commentaire").input(f"Commentaire de charge {compte['nom']}")
+    _bouton(at, "Envoyer").click().run()
+    return _succes(at, "Réponse enregistrée")
+
+def _soumission_materiaux(at, compte, rng):
+    if at.session_state["voted"]:
+        return None
+    _par_libelle(at.text_input, "Nom du matériau").input(rng.choice(["Béton C25", "Acier S235", "Bois lamellé"]))
+    for s in at.slider:
+        s.set_value(rng.randint(0, 100))
+    _par_libelle(at.text_area, "Commentaire").input(f"Commentaire de charge {compte['nom']}")
+    _bouton(at, "Envoyer").click().run()
+    return _succes(at, "Réponse enregistrée")
+
+def _soumission_ponts(at, compte, rng):
+    at.text_input(key="name_input").input(compte["nom"])
+    at.text_input(key="bridge_input").input(f"Pont {rng.randint(1, 50)}")
+    at.text_input(key="city_input").input(rng.choice(["Yaoundé", "Douala", "Ebolowa"]))
+    for key in ["note_sec", "note_def", "note_cor", "note_tab"]:
+        at.slider(key=key).set_value(rng.randint(1, 5))
+    at.text_area(key="comment_input").input(f"Inspection de charge {uuid.uuid4().hex[:8]}")
+    _bouton(at, "📥 Soumettre l'évaluation").click().run()
+    return _succes(at, "Évaluation enregistrée")
+
+def _lecture(at):
+    at.run()
+    return not at.exception
+
+
+def run_session(app, iterations, mix, timeout, graine):
+    """Une session simulée ; renvoie les mesures (op, durée, ok) et les écritures confirmées."""
+    rng = random.Random(graine)  # propre à la session : les threads partagent le module random
+    mesures = []
+    confirmees = {"inscription": 0, "soumission": 0}
+    compte = {
+        "nom": f"charge_{uuid.uuid4().hex[:10]}",
+        "email": f"{uuid.uuid4().hex[:10]}@charge.local",
+        "password": "charge",
+        "age": rng.randint(18, 80),
+        "sexe": rng.choice(["Homme", "Femme", "Autre"]),
+    }
+    at = _nouvelle_session(app, timeout)
+    _chronometre(mesures, "lecture", lambda: _lecture(at))
+
+    if app in ("sondage", "materiaux"):
+        soumettre = _soumission_sondage if app == "sondage" else _soumission_materiaux
+        if _chronometre(mesures, "inscription", lambda: _inscription(at, compte)):
+            confirmees["inscription"] += 1
+        _chronometre(mesures, "connexion", lambda: _connexion(at, compte))
+    else:
+        soumettre = _soumission_ponts
+
+    ops, poids = zip(*mix.items())
+    for _ in range(iterations):
+        op = rng.choices(ops, weights=poids)[0]
+        if op == "soumission":
+            if _chronometre(mesures, op, lambda: soumettre(at, compte, rng)):
+                confirmees["soumission"] += 1
+        elif op == "connexion" and app != "ponts":
+            _chronometre(mesures, op, lambda: _connexion(at, compte))
+        else:
+            _chronometre(mesures, "lecture", lambda: _lecture(at))
+    return mesures, confirmees
+
+
+def _init_worker(dossier):
+    os.chdir(dossier)
+    import matplotlib
+    matplotlib.use("Agg")
+
+
+# -----------------------------
+# COMPTAGE DES ÉCRITURES
+# -----------------------------
+def compter_lignes(app, dossier):
+    """Nombre d'enregistrements effectivement présents après la charge (None si illisible)."""
+    from stockage import creer_stockage
+    lignes = {"inscription": None, "soumission": None}
+    cwd = os.getcwd()
+    os.chdir(dossier)  # chemins relatifs du stockage, comme dans les workers
+    try:
+        stockage = creer_stockage(os.environ.get("STOCKAGE_URL"))
+        try:
+            lignes["inscription"] = len(stockage.lister_utilisateurs())
+        except Exception:
+            pass
+        try:
+            if app == "ponts":
+                lignes["soumission"] = len(stockage.lire_evaluations()[0])
+            else:
+                lignes["soumission"] = len(stockage.lire_reponses(JEUX[app]))
+        except Exception:
+            pass
+    finally:
+        os.chdir(cwd)
+    if app == "ponts":
+        lignes["inscription"] = 0
+    return lignes
+
+
+def _executer(app, sessions, iterations, mix, timeout, graine, mode, dossier):
+    args = [(app, iterations, mix, timeout, graine + i) for i in range(sessions)]
+    if mode == "processus":
+        with ProcessPoolExecutor(max_workers=sessions, initializer=_init_worker, initargs=(dossier,)) as pool:
+            return list(pool.map(run_session, *zip(*args)))
+    # threads : un seul processus, le répertoire courant est global
+    import syntheses
+    from streamlit import config
+    # AppTest recompile le script à chaque rerun ; les "magic" passent par ast.parse, qui
+    # n'est pas sûr entre threads en CPython 3.11 ("AST constructor recursion depth mismatch")
+    config.set_option("runner.magicEnabled", False)
+    cwd = os.getcwd()
+    _init_worker(dossier)
+    try:
+        with ThreadPoolExecutor(max_workers=sessions, thread_name_prefix="session") as pool:
+            return list(pool.map(run_session, *zip(*args)))
+    finally:
+        # la tâche des synthèses lancée par l'application (chemins relatifs) s'arrête
+        # avant le retour au répertoire d'origine et la suppression du dossier
+        syntheses.arreter()
+        os.chdir(cwd)
+
+
+def _percentiles(d):
+    return {
+        "p50_ms": round(float(np.percentile(d, 50)), 1),
+        "p95_ms": round(float(np.percentile(d, 95)), 1),
+        "p99_ms": round(float(np.percentile(d, 99)), 1),
+        "max_ms": round(float(d.max()), 1),
+    }
+
+
+def lancer_charge(app, sessions, iterations, mix, timeout, graine=0, mode="threads"):
+    dossier = tempfile.mkdtemp(prefix=f"charge_{app}_")
+    try:
+        t0 = time.perf_counter()
+        resultats = _executer(app, sessions, iterations, mix, timeout, graine, mode, dossier)
+        duree = time.perf_counter() - t0
+
+        mesures = pd.DataFrame([(i, *m) for i, r in enumerate(resultats) for m in r[0]],
+                               columns=["session", "op", "duree", "ok"])
+        confirmees = {k: sum(r[1][k] for r in resultats) for k in ["inscription", "soumission"]}
+        presentes = compter_lignes(app, dossier)
+    finally:
+        shutil.rmtree(dossier, ignore_errors=True)
+
+    lignes = []
+    for op, grp in mesures.groupby("op"):
+        lignes.append({
+            "app": app,
+            "op": op,
+            "n": len(grp),
+            "echecs": int((~grp["ok"]).sum()),
+            **_percentiles(grp["duree"].to_numpy() * 1000),
+        })
+    # Latences vues par chaque session (toutes opérations confondues)
+    par_session = pd.DataFrame([
+        {"session": i, "n": len(grp), "echecs": int((~grp["ok"]).sum()),
+         **_percentiles(grp["duree"].to_numpy() * 1000)}
+        for i, grp in mesures.groupby("session")
+    ])
+    resume = {
+        "app": app,
+        "mode": mode,
+        "sessions": sessions,
+        "duree_s": round(duree, 2),
+        "debit_ops_s": round(len(mesures) / duree, 2) if duree else 0.0,
+        "ecritures_perdues": {
+            k: (None if presentes[k] is None else max(confirmees[k] - presentes[k], 0))
+            for k in confirmees
+        },
+        "ecritures_confirmees": confirmees,
+        "ecritures_presentes": presentes,
+        # dispersion entre sessions : une session lente reste visible derrière de bons percentiles globaux
+        "sessions_p95_ms": _percentiles(par_session["p95_ms"].to_numpy()) if len(par_session) else None,
+    }
+    return pd.DataFrame(lignes), par_session.assign(app=app), resume
+
+
+# -----------------------------
+# EXECUTION
+# -----------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Test de charge des applications Streamlit (sessions concurrentes).")
+    parser.add_argument("--apps", nargs="+", choices=sorted(APPS), default=sorted(APPS))
+    parser.add_argument("--sessions", type=int, default=10, help="sessions simultanées par application")
+    parser.add_argument("--iterations", type=int, default=5, help="opérations par session après la connexion")
+    parser.add_argument("--mix", default=None, help='poids JSON, ex. \'{"lecture": 6, "soumission": 2, "connexion": 2}\'')
+    parser.add_argument("--timeout", type=float, default=60.0, help="délai max d'un rerun (s)")
+    parser.add_argument("--graine", type=int, default=0)
+    parser.add_argument("--json", dest="json_out", default=None, help="écrit le rapport complet dans ce fichier")
+    parser.add_argument("--mode", choices=MODES, default="threads",
+                        help="threads : sessions d'un même processus (cache partagé) ; processus : une par processus")
+    parser.add_argument("--stockage", default=None, help="STOCKAGE_URL à tester, ex. sqlite:///charge.db (défaut : fichiers)")
+    args = parser.parse_args(argv)
+    if args.stockage is not None:
+        # hérité par les sessions ; chemins relatifs résolus dans le dossier temporaire
+        os.environ["STOCKAGE_URL"] = args.stockage
+
+    mix = json.loads(args.mix) if args.mix else MIX_DEFAUT
+    tables, sessions, resumes = [], [], []
+    for app in args.apps:
+        table, par_session, resume = lancer_charge(app, args.sessions, args.iterations, mix, args.timeout,
+                                                   args.graine, args.mode)
+        tables.append(table)
+        sessions.append(par_session)
+        resumes.append(resume)
+        print(f"\n=== {app} ({resume['mode']}) : {resume['sessions']} sessions, {resume['duree_s']} s, "
+              f"{resume['debit_ops_s']} ops/s")
+        print(table.drop(columns="app").to_string(index=False))
+        print("\nPar session :")
+        print(par_session.drop(columns="app").to_string(index=False))
+        print(f"p95 par session (répartition) : {resume['sessions_p95_ms']}")
+        print(f"Écritures perdues : {resume['ecritures_perdues']}")
+
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump({
+                "latences": pd.concat(tables, ignore_index=True).to_dict(orient="records"),
+                "sessions": pd.concat(sessions, ignore_index=True).to_dict(orient="records"),
+                "resumes": resumes,
+            }, f, indent=4, ensure_ascii=False)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,152 @@
+# doublons.py
+# Détection des soumissions en double : empreinte exacte des champs normalisés
+# (double clic, nouvel envoi après un enregistrement lent) et signatures
+# MinHash / LSH du commentaire pour les quasi-doublons (copier-coller d'un
+# pont à l'autre, d'un répondant à l'autre).
+#
+# La recherche ne compare la signature qu'aux entrées qui partagent au moins
+# une bande LSH : son coût ne dépend pas de la taille de l'index.
+import hashlib
+import re
+import threading
+import zlib
+from collections import namedtuple
+
+import numpy as np
+
+from noms_materiaux import normaliser
+
+SEUIL = 0.8  # similarité de Jaccard estimée à partir de laquelle on signale
+PERMUTATIONS = 128
+BANDES = 32  # 32 bandes x 4 lignes : candidats dès ~0.45 de similarité, vérifiés ensuite
+LONGUEUR_MIN = 20  # en dessous ("RAS", "Bon travail"), seul le doublon exact compte
+K_SHINGLE = 5
+
+_P = (1 << 31) - 1
+# graine fixe : signatures identiques d'un processus à l'autre
+_rng = np.random.default_rng(20240601)
+_A = _rng.integers(1, _P, PERMUTATIONS, dtype=np.uint64)
+_B = _rng.integers(0, _P, PERMUTATIONS, dtype=np.uint64)
+
+# type : "exact" ou "proche" ("ancien" : exact mais daté, voir pont_donnees._dater_doublon)
+Doublon = namedtuple("Doublon", ["type", "id", "similarite"])
+
+
+def normaliser_texte(txt):
+    if txt is None or txt != txt:  # None / NaN
+        return ""
+    return " ".join(re.sub(r"[^\w\s]", " ", normaliser(txt)).split())
+
+def empreinte(valeurs):
+    """Empreinte exacte d'une soumission (valeurs normalisées, dans l'ordre)."""
+    return hashlib.sha1("\x1f".join(normaliser_texte(v) for v in valeurs).encode()).hexdigest()
+
+def signature(texte):
+    """Signature MinHash (PERMUTATIONS entiers) des k-grammes de caractères du texte normalisé."""
+    t = normaliser_texte(texte)
+    shingles = {t[i:i + K_SHINGLE] for i in range(max(1, len(t) - K_SHINGLE + 1))}
+    h = np.fromiter((zlib.crc32(s.encode()) for s in shingles), dtype=np.uint64, count=len(shingles))
+    # toutes les permutations d'un coup : (PERMUTATIONS, shingles) puis min par ligne
+    return ((np.outer(_A, h) + _B[:, None]) % _P).min(axis=1)
+
+
+class IndexDoublons:
+    """Empreintes exactes + buckets LSH des signatures, mis à jour à chaque ajout."""
+
+    def __init__(self, seuil=SEUIL, bandes=BANDES):
+        self.seuil = seuil
+        self.bandes = bandes
+        self.lignes = PERMUTATIONS // bandes
+        self._verrou = threading.Lock()
+        self._exact = {}
+        self._empreinte_de = {}
+        self._signatures = {}
+        self._buckets = {}
+
+    def __len__(self):
+        return len(self._empreinte_de)
+
+    def _cles_bandes(self, sig):
+        r = self.lignes
+        return [(b, sig[b * r:(b + 1) * r].tobytes()) for b in range(self.bandes)]
+
+    def ajouter(self, id_, empreinte_exacte, texte):
+        """Ajoute (ou remplace, après une modification) l'entrée `id_`."""
+        long = len(normaliser_texte(texte)) >= LONGUEUR_MIN
+        sig = signature(texte) if long else None
+        with self._verrou:
+            ancienne = self._empreinte_de.get(id_)
+            if ancienne is not None and self._exact.get(ancienne) == id_:
+                del self._exact[ancienne]
+            self._exact[empreinte_exacte] = id_  # la plus récente : c'est elle qu'un renvoi reproduit
+            self._empreinte_de[id_] = empreinte_exacte
+            # les anciens buckets de id_ restent : la vérification utilise la signature courante
+            if sig is None:
+                self._signatures.pop(id_, None)
+                return
+            self._signatures[id_] = sig
+            for cle in self._cles_bandes(sig):
+                self._buckets.setdefault(cle, []).append(id_)
+
+    def chercher(self, empreinte_exacte, texte, exclure=None):
+        """Doublon le plus proche (exact d'abord), ou None."""
+        with self._verrou:
+            id_ = self._exact.get(empreinte_exacte)
+        if id_ is not None and id_ != exclure:
+            return Doublon("exact", id_, 1.0)
+        if len(normaliser_texte(texte)) < LONGUEUR_MIN:
+            return None
+        sig = signature(texte)
+        with self._verrou:
+            candidats = set()
+            for cle in self._cles_bandes(sig):
+                candidats.update(self._buckets.get(cle, ()))
+            candidats.discard(exclure)
+            meilleur = None
+            for c in candidats:
+                autre = self._signatures.get(c)
+                if autre is None:
+                    continue
+                sim = float(np.mean(autre == sig))
+                if sim >= self.seuil and (meilleur is None or sim > meilleur.similarite):
+                    meilleur = Doublon("proche", c, round(sim, 2))
+        return meilleur
+
+
+class IndexReponses:
+    """Index des commentaires d'un jeu de réponses (ajout seul : indexé par position).
+
+    `cle` : colonne qui identifie le répondant du jeu ; les lignes sans valeur
+    appartiennent à un autre jeu du même classeur (avis et materiaux partagent
+    resultats.xlsx) et ne sont pas indexées.
+    """
+
+    def __init__(self, colonne="Commentaire", cle=None):
+        self.colonne = colonne
+        self.cle = cle
+        self.index = IndexDoublons()
+        self.n = 0
+        self._verrou = threading.Lock()
+
+    def mettre_a_jour(self, df):
+        # N'indexe que les lignes ajoutées depuis le dernier appel
+        with self._verrou:
+            if len(df) < self.n:  # jeu réécrit : on repart de zéro
+                self.index, self.n = IndexDoublons(), 0
+            if self.colonne in df.columns:
+                nouvelles = df.iloc[self.n:]
+                textes = nouvelles[self.colonne].tolist()
+                if self.cle is None:
+                    gardees = range(len(textes))
+                elif self.cle in df.columns:
+                    gardees = np.flatnonzero(nouvelles[self.cle].notna().to_numpy())
+                else:
+                    gardees = []
+                for i in gardees:
+                    self.index.ajouter(self.n + int(i), empreinte([textes[i]]), textes[i])
+            self.n = len(df)
+        return self
+
+    def chercher(self, texte):
+        # Doublon exact quelle que soit la longueur ; quasi-doublon au-delà de LONGUEUR_MIN (IndexDoublons)
+        return self.index.chercher(empreinte([texte]), texte)
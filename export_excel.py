@@ -0,0 +1,167 @@
+# export_excel.py
+# Export Excel des réponses aux sondages et des évaluations de ponts.
+#
+# Les lignes sont écrites par blocs dans un classeur openpyxl en mode
+# write-only (jamais de classeur complet en mémoire), dans un thread de fond,
+# et le dernier fichier produit est conservé par version du jeu de données :
+# un second export de la même version est servi directement.
+#
+#   python export_excel.py avis export_avis.xlsx
+#   python export_excel.py avis export_ebolowa.xlsx --zone Ebolowa
+#   python export_excel.py evaluations export_ponts.xlsx
+import argparse
+import hashlib
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import pandas as pd
+
+from import_masse import COLS_MATERIAUX, COLS_REPONSES
+from pont_donnees import COLUMNS, lire_par_blocs
+from stockage import BLOC, get_stockage, remplacement_atomique
+from zones import jeu_zone
+
+# -----------------------------
+# CONFIG
+# -----------------------------
+EXPORT_DIR = "exports"
+COLONNES_JEUX = {"avis": COLS_REPONSES, "materiaux": COLS_MATERIAUX}
+# Colonne du répondant de chaque jeu (avis et materiaux partagent resultats.xlsx)
+CLES_JEUX = {"avis": "Nom", "materiaux": "NomUtilisateur"}
+
+
+# -----------------------------
+# ÉCRITURE EN FLUX
+# -----------------------------
+def _cellules(bloc):
+    # Valeurs Python natives pour openpyxl : NaN/NA/NaT -> cellule vide
+    cols = {}
+    for col in bloc.columns:
+        s = bloc[col]
+        if pd.api.types.is_datetime64_any_dtype(s):
+            s = pd.Series(s.dt.to_pydatetime(), index=s.index, dtype=object)
+        cols[col] = s.astype(object)
+    bloc = pd.DataFrame(cols, index=bloc.index)
+    return bloc.where(bloc.notna(), None).itertuples(index=False, name=None)
+
+def ecrire_xlsx(dest, colonnes, blocs, feuille="Données"):
+    """Écrit les blocs (DataFrames) dans un nouveau classeur write-only ; renvoie le nombre de lignes."""
+    from openpyxl import Workbook
+    n = 0
+    with remplacement_atomique(dest) as tmp:
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet(feuille)
+        ws.append(colonnes)
+        for bloc in blocs:
+            for r in _cellules(bloc.reindex(columns=colonnes)):
+                ws.append(list(r))
+            n += len(bloc)
+        wb.save(tmp)
+    return n
+
+def blocs_dataframe(df, taille=BLOC):
+    # DataFrame déjà en mémoire, découpé pour la conversion cellule par cellule
+    for debut in range(0, len(df), taille):
+        yield df.iloc[debut:debut + taille]
+
+
+# -----------------------------
+# EXPORTS EN ARRIÈRE-PLAN, EN CACHE PAR VERSION
+# -----------------------------
+class Exports:
+    """Exports Excel du processus : un thread de fond, un fichier par (nom, version)."""
+
+    def __init__(self, dossier=EXPORT_DIR, max_workers=1):
+        self.dossier = dossier
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="export_xlsx")
+        self._verrou = threading.Lock()
+        self._en_cours = {}
+        os.makedirs(dossier, exist_ok=True)
+
+    def chemin(self, nom, version):
+        cle = hashlib.sha1(repr(version).encode()).hexdigest()[:12]
+        return os.path.join(self.dossier, f"{nom}_{cle}.xlsx")
+
+    def demander(self, nom, version, colonnes, blocs):
+        """Future du chemin de l'export ; `blocs` (appelable) n'est lu que si l'export manque."""
+        path = self.chemin(nom, version)
+        with self._verrou:
+            if path in self._en_cours:
+                return self._en_cours[path]
+            if os.path.exists(path):
+                fut = Future()
+                fut.set_result(path)
+                return fut
+            fut = self._pool.submit(self._exporter, nom, path, colonnes, blocs)
+            self._en_cours[path] = fut
+            return fut
+
+    def _exporter(self, nom, path, colonnes, blocs):
+        try:
+            ecrire_xlsx(path, colonnes, blocs())
+            self._purger(nom, garder=path)
+            return path
+        finally:
+            with self._verrou:
+                self._en_cours.pop(path, None)
+
+    def _purger(self, nom, garder):
+        # Seul le dernier export de chaque jeu de données est conservé
+        motif = re.compile(re.escape(nom) + r"_[0-9a-f]{12}\.xlsx")  # "avis" ne purge pas "avis_ebolowa"
+        for f in os.listdir(self.dossier):
+            path = os.path.join(self.dossier, f)
+            if motif.fullmatch(f) and path != garder:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+
+def source_jeu(jeu, stockage=None, taille=BLOC, zone=None):
+    """(partition, colonnes, blocs) d'un jeu de réponses ; `blocs()` lit les seules lignes du jeu."""
+    stockage = stockage or get_stockage()
+    colonnes = COLONNES_JEUX.get(jeu) or list(stockage.lire_reponses(jeu).columns)
+    cle = CLES_JEUX.get(jeu)
+    if zone is not None and jeu == "avis":
+        jeu = jeu_zone(zone)  # partition de la zone
+    return jeu, colonnes, lambda: stockage.reponses_par_blocs(jeu, colonnes, taille, cle=cle)
+
+def exporter_jeu(jeu, dest, stockage=None, taille=BLOC, zone=None):
+    _, colonnes, blocs = source_jeu(jeu, stockage, taille, zone)
+    return ecrire_xlsx(dest, colonnes, blocs())
+
+def demander_export_jeu(exports, jeu, stockage=None, zone=None):
+    # Comme l'export des évaluations : thread de fond de `exports`, fichier gardé par version des réponses
+    stockage = stockage or get_stockage()
+    partition, colonnes, blocs = source_jeu(jeu, stockage, zone=zone)
+    return exports.demander(f"reponses_{partition}", stockage.version_reponses(partition), colonnes, blocs)
+
+def exporter_evaluations(dest, stockage=None, taille=BLOC, **filtres):
+    # Lu en flux (corrections appliquées bloc par bloc) : mémoire bornée quel que soit le volume
+    return ecrire_xlsx(dest, COLUMNS, lire_par_blocs(stockage or get_stockage(), taille, **filtres))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export Excel en flux des réponses ou des évaluations.")
+    parser.add_argument("jeu", help="avis, materiaux ou evaluations")
+    parser.add_argument("dest", help="fichier .xlsx à écrire")
+    parser.add_argument("--taille", type=int, default=BLOC, help="lignes par bloc")
+    parser.add_argument("--zone", default=None, help="zone du sondage d'avis (défaut : campagne historique)")
+    parser.add_argument("--ville", default=None, help="évaluations d'une seule ville")
+    args = parser.parse_args(argv)
+
+    t0 = time.perf_counter()
+    if args.jeu == "evaluations":
+        n = exporter_evaluations(args.dest, taille=args.taille, ville=args.ville)
+    else:
+        n = exporter_jeu(args.jeu, args.dest, taille=args.taille, zone=args.zone)
+    print(f"{n} lignes exportées dans {args.dest} en {time.perf_counter() - t0:.1f} s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,270 @@
+# import_masse.py
+# Import en masse (ligne de commande) des évaluations de ponts historiques et
+# des réponses aux sondages (avis / matériaux).
+#
+#   python import_masse.py evaluations inspections_2015_2023.csv
+#   python import_masse.py reponses anciennes_reponses.xlsx --dest resultats.xlsx
+#   python import_masse.py reponses reponses_ebolowa.csv --zone Ebolowa
+#   python import_masse.py materiaux reponses_materiaux.csv --dest resultats.xlsx
+#
+# Les fichiers sont lus par blocs, validés de façon vectorielle, puis écrits via
+# stockage.py en une seule opération (fichier temporaire + os.replace, ou une
+# transaction SQL) : soit tout le lot est importé, soit rien ne change.
+# Un ID d'évaluation (ou une personne, pour les réponses) déjà vu dans le
+# fichier ou déjà présent dans le stockage est rejeté comme doublon.
+import argparse
+import os
+import sys
+import time
+import uuid
+from datetime import datetime
+
+import pandas as pd
+
+from pont_donnees import BORNES_COORD, COLUMNS, RATING_COLS, TIMESTAMP_FORMAT, compute_index_frame, nombres
+from stockage import StockageFichiers, get_stockage
+from zones import jeu_zone
+
+# -----------------------------
+# SCHÉMAS DES SONDAGES
+# -----------------------------
+AVIS = ["Très bon", "Bon", "Moyen", "Mauvais"]
+SEXES = ["Homme", "Femme", "Autre"]
+COLS_REPONSES = ["Nom", "Age", "Sexe", "Avis", "Commentaire"]
+
+PROPRIETES_MATERIAU = ["Res_Traction", "Durete", "Module_Elasticite",
+                       "pH", "Corrosivite", "Composition",
+                       "Conductivite", "Capacite_Calorifique", "Expansion"]
+COLS_MATERIAUX = ["NomUtilisateur", "AgeUtilisateur", "SexeUtilisateur",
+                  "Materiau"] + PROPRIETES_MATERIAU + ["Commentaire"]
+
+CHUNKSIZE = 50_000
+
+
+# -----------------------------
+# LECTURE PAR BLOCS
+# -----------------------------
+def lire_par_blocs(path, chunksize=CHUNKSIZE):
+    """Itère sur un CSV ou un classeur Excel par DataFrames de `chunksize` lignes (tout en str)."""
+    if path.lower().endswith((".xlsx", ".xlsm")):
+        from openpyxl import load_workbook
+        wb = load_workbook(path, read_only=True, data_only=True)
+        try:
+            rows = wb.active.iter_rows(values_only=True)
+            header = [str(h).strip() if h is not None else "" for h in next(rows, [])]
+            bloc = []
+            for r in rows:
+                bloc.append(r)
+                if len(bloc) >= chunksize:
+                    yield pd.DataFrame(bloc, columns=header).astype("string").astype(object)
+                    bloc = []
+            if bloc:
+                yield pd.DataFrame(bloc, columns=header).astype("string").astype(object)
+        finally:
+            wb.close()
+    else:
+        for bloc in pd.read_csv(path, dtype=str, chunksize=chunksize, keep_default_na=False):
+            bloc.columns = [c.strip() for c in bloc.columns]
+            yield bloc
+
+
+# -----------------------------
+# VALIDATION VECTORIELLE
+# -----------------------------
+def _texte(df, col):
+    if col not in df.columns:
+        return pd.Series("", index=df.index, dtype=object)
+    return df[col].fillna("").astype(str).str.strip()
+
+def _nombre(df, col):
+    # accepte la virgule décimale ("3,85"), comme le formulaire (pont_donnees.lire_coordonnee)
+    return nombres(_texte(df, col))
+
+def _motifs(df, regles):
+    """Concatène le nom des règles violées par ligne ("" = ligne valide)."""
+    motifs = pd.Series("", index=df.index, dtype=object)
+    for nom, invalide in regles.items():
+        motifs = motifs.where(~invalide, motifs + nom + ";")
+    return motifs.str.rstrip(";")
+
+
+def preparer_evaluations(df, vus=None):
+    """Normalise et valide un bloc d'évaluations ; renvoie (lignes valides, lignes rejetées).
+
+    `vus` : IDs déjà importés ou présents dans le stockage, complété avec ceux du bloc.
+    """
+    vus = set() if vus is None else vus
+    out = pd.DataFrame(index=df.index)
+    for c in ["Nom", "Pont", "Ville", "Type_pont", "Etat_tablier", "Commentaire", "Photos"]:
+        out[c] = _texte(df, c)
+
+    regles = {
+        "nom_manquant": out["Nom"] == "",
+        "pont_manquant": out["Pont"] == "",
+        "commentaire_manquant": out["Commentaire"] == "",
+    }
+    for c in RATING_COLS:
+        note = _nombre(df, c)
+        invalide = note.isna() | (note < 1) | (note > 5) | (note != note.round())
+        regles[f"{c.lower()}_hors_1_5"] = invalide
+        # conversion des seules notes valides ("2.5" ferait échouer astype)
+        out[c] = note.where(~invalide).astype("Int64")
+
+    for c, borne in BORNES_COORD.items():
+        brut = _texte(df, c)
+        val = _nombre(df, c)
+        regles[f"{c.lower()}_invalide"] = (brut != "") & (val.isna() | (val.abs() > borne))
+        out[c] = val
+
+    brut_ts = _texte(df, "Timestamp")
+    ts = pd.to_datetime(brut_ts.where(brut_ts != ""), errors="coerce")
+    regles["timestamp_invalide"] = (brut_ts != "") & ts.isna()
+    out["Timestamp"] = ts.fillna(pd.Timestamp(datetime.now())).dt.strftime(TIMESTAMP_FORMAT)
+
+    ids = _texte(df, "ID")
+    sans_id = ids == ""
+    ids[sans_id] = [uuid.uuid4().hex for _ in range(int(sans_id.sum()))]
+    out["ID"] = ids
+    regles["id_en_double"] = ids.duplicated(keep="first") | ids.isin(vus)
+
+    out["Indice_Etat"] = compute_index_frame(out)
+
+    motifs = _motifs(df, regles)
+    valides = out[motifs == ""][COLUMNS]
+    vus.update(valides["ID"])
+    rejets = df[motifs != ""].assign(Motif=motifs[motifs != ""])
+    return valides, rejets
+
+
+def _age(df, col):
+    # (âge entier ou NA, règle "age_invalide") : un âge fractionnaire est rejeté, pas converti
+    age = _nombre(df, col)
+    entier = age == age.round()
+    return age.where(entier).astype("Int64"), age.notna() & (~entier | (age < 1) | (age > 120))
+
+def preparer_reponses(df, vus=None):
+    # `vus` : noms ayant déjà répondu (fichier ou stockage), complété avec ceux du bloc
+    vus = set() if vus is None else vus
+    out = pd.DataFrame(index=df.index)
+    for c in ["Nom", "Sexe", "Avis", "Commentaire"]:
+        out[c] = _texte(df, c)
+    out["Age"], age_invalide = _age(df, "Age")
+    regles = {
+        "nom_manquant": out["Nom"] == "",
+        "avis_inconnu": ~out["Avis"].isin(AVIS),
+        "commentaire_manquant": out["Commentaire"] == "",
+        "age_invalide": age_invalide,
+        "sexe_inconnu": (out["Sexe"] != "") & ~out["Sexe"].isin(SEXES),
+        "nom_en_double": out["Nom"].duplicated(keep="first") | out["Nom"].isin(vus),
+    }
+    motifs = _motifs(df, regles)
+    valides = out[motifs == ""][COLS_REPONSES]
+    vus.update(valides["Nom"])
+    return valides, df[motifs != ""].assign(Motif=motifs[motifs != ""])
+
+
+def preparer_materiaux(df, vus=None):
+    vus = set() if vus is None else vus
+    out = pd.DataFrame(index=df.index)
+    for c in ["NomUtilisateur", "SexeUtilisateur", "Materiau", "Commentaire"]:
+        out[c] = _texte(df, c)
+    out["AgeUtilisateur"], age_invalide = _age(df, "AgeUtilisateur")
+    regles = {
+        "nom_manquant": out["NomUtilisateur"] == "",
+        "materiau_manquant": out["Materiau"] == "",
+        "commentaire_manquant": out["Commentaire"] == "",
+        "age_invalide": age_invalide,
+        "nom_en_double": out["NomUtilisateur"].duplicated(keep="first") | out["NomUtilisateur"].isin(vus),
+    }
+    for c in PROPRIETES_MATERIAU:
+        val = _nombre(df, c)
+        regles[f"{c.lower()}_hors_0_100"] = val.isna() | (val < 0) | (val > 100)
+        out[c] = val
+    motifs = _motifs(df, regles)
+    valides = out[motifs == ""][COLS_MATERIAUX]
+    vus.update(valides["NomUtilisateur"])
+    return valides, df[motifs != ""].assign(Motif=motifs[motifs != ""])
+
+
+# -----------------------------
+# COMMANDES
+# -----------------------------
+# type -> (validation, colonnes, jeu de réponses ; None = évaluations de ponts)
+TYPES = {
+    "evaluations": (preparer_evaluations, COLUMNS, None),
+    "reponses": (preparer_reponses, COLS_REPONSES, "avis"),
+    "materiaux": (preparer_materiaux, COLS_MATERIAUX, "materiaux"),
+}
+# colonne « une réponse par personne » de chaque type de réponses
+CLES = {"reponses": "Nom", "materiaux": "NomUtilisateur"}
+
+def _stockage_cible(jeu, dest):
+    # --dest : fichier explicite (backend fichiers) ; sinon le stockage des applications
+    if dest is None:
+        return get_stockage()
+    if jeu is None:
+        return StockageFichiers(data_file=dest)
+    return StockageFichiers(fichiers_jeux={jeu: dest})
+
+def _description(stockage, jeu):
+    if isinstance(stockage, StockageFichiers):
+        return stockage.data_file if jeu is None else stockage.fichier_jeu(jeu)
+    return os.environ.get("STOCKAGE_URL", "")
+
+def importer(type_donnees, source, dest=None, rejets=None, chunksize=CHUNKSIZE, zone=None):
+    preparer, colonnes, jeu = TYPES[type_donnees]
+    if zone is not None and type_donnees == "reponses":
+        jeu = jeu_zone(zone)  # partition de la zone
+    stockage = _stockage_cible(jeu, dest)
+    rejets = rejets or os.path.splitext(source)[0] + "_rejets.csv"
+    stats = {"lues": 0, "valides": 0, "importees": 0, "rejetees": 0}
+    if os.path.exists(rejets):
+        os.remove(rejets)
+    # doublons : contre le stockage existant et d'un bloc à l'autre
+    vus = stockage.ids_evaluations() if jeu is None else stockage.cles_reponses(jeu, CLES[type_donnees])
+
+    def blocs_valides():
+        for bloc in lire_par_blocs(source, chunksize):
+            stats["lues"] += len(bloc)
+            valides, rej = preparer(bloc, vus)
+            if not rej.empty:
+                rej.to_csv(rejets, mode="a", header=not os.path.exists(rejets), index=False)
+                stats["rejetees"] += len(rej)
+            stats["valides"] += len(valides)
+            yield valides
+
+    if jeu is None:
+        stats["importees"] = stockage.importer_evaluations(blocs_valides())
+    else:
+        stats["importees"] = stockage.importer_reponses(jeu, colonnes, blocs_valides(), cle=CLES[type_donnees])
+    # déjà présentes dans le stockage (écrites entre-temps par une application) : sautées
+    stats["ignorees"] = stats["valides"] - stats["importees"]
+    stats["dest"] = _description(stockage, jeu)
+    stats["rejets"] = rejets if stats["rejetees"] else None
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import en masse d'évaluations de ponts et de réponses aux sondages.")
+    parser.add_argument("type", choices=sorted(TYPES))
+    parser.add_argument("source", help="fichier CSV ou Excel à importer")
+    parser.add_argument("--dest", default=None, help="fichier de destination (défaut : le stockage des applications, voir STOCKAGE_URL)")
+    parser.add_argument("--rejets", default=None, help="CSV des lignes rejetées avec leur motif")
+    parser.add_argument("--chunksize", type=int, default=CHUNKSIZE)
+    parser.add_argument("--zone", default=None, help="zone du sondage d'avis (défaut : campagne historique)")
+    args = parser.parse_args(argv)
+
+    t0 = time.perf_counter()
+    stats = importer(args.type, args.source, args.dest, args.rejets, args.chunksize, args.zone)
+    duree = time.perf_counter() - t0
+    print(f"{stats['importees']} lignes importées dans {stats['dest']} "
+          f"({stats['lues']} lues, {stats['rejetees']} rejetées) en {duree:.1f} s")
+    if stats["ignorees"]:
+        print(f"{stats['ignorees']} lignes déjà présentes dans le stockage, ignorées")
+    if stats["rejets"]:
+        print(f"Lignes rejetées : {stats['rejets']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,71 @@
+# intervalles.py
+# Intervalles de confiance des parts d'un sondage (part de chaque avis, au
+# total ou par segment) à partir des seuls comptes : Wilson (formule fermée)
+# ou bootstrap multinomial.
+#
+# Le bootstrap tire toutes les répliques de tous les segments en un seul
+# appel NumPy (Generator.multinomial sur le vecteur de comptes) : aucune
+# boucle sur les répondants ni sur les répliques.
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+NIVEAU = 0.95
+REPLIQUES = 10_000
+
+
+def _z(niveau):
+    return NormalDist().inv_cdf((1 + niveau) / 2)
+
+def wilson(k, n, niveau=NIVEAU):
+    """Bornes (basse, haute) de Wilson pour k succès sur n, vectorisé (NaN si n = 0)."""
+    k = np.asarray(k, dtype="float64")
+    n = np.asarray(n, dtype="float64")
+    z = _z(niveau)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        p = k / n
+        denom = 1 + z**2 / n
+        centre = (p + z**2 / (2 * n)) / denom
+        demi = z * np.sqrt(p * (1 - p) / n + z**2 / (4 * n**2)) / denom
+    return centre - demi, centre + demi
+
+def bootstrap_multinomial(comptes, repliques=REPLIQUES, niveau=NIVEAU, graine=None):
+    """Bornes (basse, haute) des parts par bootstrap ; comptes de forme (segments, options)."""
+    comptes = np.atleast_2d(np.asarray(comptes, dtype=np.int64))
+    n = comptes.sum(axis=1)
+    p = comptes / np.maximum(n, 1)[:, None]
+    p[n == 0, 0] = 1.0  # segment vide : pvals valides, tirages nuls (masqués plus bas)
+    rng = np.random.default_rng(graine)
+    # (répliques, segments, options) en un seul tirage
+    tirages = rng.multinomial(n, p, size=(repliques, len(n)))
+    parts = tirages / np.maximum(n, 1)[None, :, None]
+    alpha = (1 - niveau) / 2
+    bas, haut = np.quantile(parts, [alpha, 1 - alpha], axis=0)
+    bas[n == 0] = np.nan
+    haut[n == 0] = np.nan
+    return bas, haut
+
+def intervalles_parts(comptes, methode="wilson", niveau=NIVEAU, repliques=REPLIQUES, graine=None):
+    """Parts et intervalles par segment.
+
+    `comptes` : DataFrame segments x options (index = segment, colonnes = options).
+    Renvoie une ligne par (segment, option) : n, total, part, bas, haut.
+    """
+    k = comptes.to_numpy(dtype="int64")
+    n = k.sum(axis=1)
+    if methode == "bootstrap":
+        bas, haut = bootstrap_multinomial(k, repliques, niveau, graine)
+    else:
+        bas, haut = wilson(k, n[:, None], niveau)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        part = k / n[:, None]
+    index = pd.MultiIndex.from_product([comptes.index, comptes.columns],
+                                       names=[comptes.index.name or "Segment", comptes.columns.name or "Option"])
+    return pd.DataFrame({
+        "n": k.ravel(),
+        "total": np.repeat(n, k.shape[1]),
+        "part": part.ravel(),
+        "bas": np.asarray(bas).ravel(),
+        "haut": np.asarray(haut).ravel(),
+    }, index=index).reset_index()
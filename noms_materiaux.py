@@ -0,0 +1,86 @@
+# noms_materiaux.py
+# Index des noms de matériaux saisis librement (colonne Materiau).
+#
+# Les variantes d'écriture ("Béton C25", "beton c25", "Beton  C25 ") sont
+# ramenées à une même clé normalisée (casse, accents, espaces), affichée sous
+# son écriture la plus fréquente. Un index de trigrammes sert l'autocomplétion
+# tolérante aux fautes de frappe.
+import heapq
+import re
+import unicodedata
+from collections import Counter
+
+import pandas as pd
+
+_SEPARATEURS = re.compile(r"[\s\-_/]+")
+
+
+def normaliser(nom):
+    """Clé d'un nom de matériau : sans accents, en minuscules, espaces réduits."""
+    s = unicodedata.normalize("NFKD", str(nom))
+    s = "".join(c for c in s if not unicodedata.combining(c)).casefold()
+    return _SEPARATEURS.sub(" ", s).strip()
+
+def normaliser_serie(s):
+    # Même clé que normaliser(), en une passe pandas (une seule normalisation par valeur distincte)
+    uniques = pd.Series(s.dropna().unique())
+    cles = dict(zip(uniques, uniques.map(normaliser)))
+    return s.map(cles)
+
+def trigrammes(cle):
+    t = f"  {cle} "
+    return {t[i:i + 3] for i in range(len(t) - 2)}
+
+
+class IndexMateriaux:
+    """Clé normalisée -> nom canonique, et trigrammes -> clés pour l'autocomplétion."""
+
+    def __init__(self, noms, effectifs=None):
+        # noms : écritures brutes ; effectifs : nombre d'occurrences de chacune (1 par défaut)
+        noms = pd.Series(list(noms), dtype=object)
+        effectifs = pd.Series(1 if effectifs is None else list(effectifs), index=noms.index)
+        variantes = pd.DataFrame({"nom": noms.astype(str).str.strip(), "cle": normaliser_serie(noms), "n": effectifs})
+        variantes = variantes[variantes["cle"].notna() & (variantes["cle"] != "")]
+        variantes = variantes.groupby(["cle", "nom"], sort=False)["n"].sum().reset_index()
+        # nom canonique : l'écriture la plus fréquente de la clé
+        canon = variantes.sort_values("n", ascending=False, kind="stable").drop_duplicates("cle")
+        self.canonique = dict(zip(canon["cle"], canon["nom"]))
+        self.effectif = variantes.groupby("cle")["n"].sum().to_dict()
+        self.cles = list(self.canonique)
+        self._trigrammes = {}
+        self._tailles = []
+        for i, cle in enumerate(self.cles):
+            tri = trigrammes(cle)
+            self._tailles.append(len(tri))
+            for t in tri:
+                self._trigrammes.setdefault(t, []).append(i)
+
+    def __len__(self):
+        return len(self.cles)
+
+    def __contains__(self, nom):
+        return normaliser(nom) in self.canonique
+
+    def resoudre(self, nom):
+        """Nom canonique d'une écriture quelconque (None si inconnue)."""
+        return self.canonique.get(normaliser(nom))
+
+    def suggerer(self, texte, k=10, seuil=0.3):
+        """[(nom canonique, score)] les plus proches de `texte` (coefficient de Dice sur trigrammes)."""
+        cle = normaliser(texte)
+        if not cle:
+            return []
+        requete = trigrammes(cle)
+        communs = Counter()
+        for t in requete:
+            communs.update(self._trigrammes.get(t, ()))
+        scores = []
+        for i, c in communs.items():
+            cand = self.cles[i]
+            score = 2 * c / (len(requete) + self._tailles[i])
+            if cand.startswith(cle):
+                score += 0.5  # début de saisie : prioritaire en autocomplétion
+            if score >= seuil:
+                scores.append((score, self.effectif[cand], cand))
+        meilleurs = heapq.nlargest(k, scores, key=lambda x: (x[0], x[1]))
+        return [(self.canonique[cand], round(min(score, 1.0), 3)) for score, _, cand in meilleurs]
@@ -0,0 +1,603 @@
+# pont_donnees.py
+# Données des évaluations de ponts : colonnes, schéma en mémoire, calcul de
+# l'indice d'état (ligne par ligne ou en lot) et index des évaluations.
+# La persistance est déléguée à stockage.py.
+#
+# Au-delà de SEUIL_HORS_MEMOIRE évaluations, le jeu n'est plus chargé en
+# entier : lecture en flux par blocs (lire_par_blocs) et EvaluationsArchive.
+import importlib.util
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from doublons import IndexDoublons, empreinte
+from recherche import IndexTexte, masque_texte
+
+# -----------------------
+# Config
+# -----------------------
+# Columns for CSV
+COLUMNS = [
+    "ID", "Timestamp", "Nom", "Pont", "Ville", "Latitude", "Longitude",
+    "Type_pont", "Etat_tablier", "Commentaire",
+    "Note_Securite", "Note_Deformation", "Note_Corrosion", "Note_Tablier",
+    "Indice_Etat", "Photos"  # photos stored as semicolon separated filenames
+]
+# Journal des corrections : ID, Timestamp, Champ, Valeur
+CORRECTIONS_COLUMNS = ["ID", "Timestamp", "Champ", "Valeur"]
+
+RATING_COLS = ["Note_Securite", "Note_Deformation", "Note_Corrosion", "Note_Tablier"]
+# Weighted average (example weights)
+RATING_WEIGHTS = np.array([0.4, 0.2, 0.2, 0.2])
+
+# Schéma compact en mémoire : notes en petits entiers, indice en float32,
+# colonnes peu variées (dont évaluateurs et ponts) en catégories, horodatage
+# en datetime64, texte libre en chaînes "str" (voir TYPE_TEXTE).
+# Utilisé au chargement, au filtrage et pour les graphiques.
+SCHEMA = {
+    "ID": "str",
+    "Timestamp": "datetime64[ns]",
+    "Nom": "category",
+    "Pont": "category",
+    "Ville": "category",
+    "Latitude": "float64",
+    "Longitude": "float64",
+    "Type_pont": "category",
+    "Etat_tablier": "category",
+    "Commentaire": "str",
+    "Note_Securite": "Int8",
+    "Note_Deformation": "Int8",
+    "Note_Corrosion": "Int8",
+    "Note_Tablier": "Int8",
+    "Indice_Etat": "float32",
+    "Photos": "str",
+}
+
+def _type_texte():
+    # Chaînes Arrow avec NaN pour les manquants : le "str" par défaut de pandas 3, et son
+    # équivalent en pandas 2.1-2.2 ; sans pyarrow, "str" (pandas 3) ou object (pandas 2)
+    if importlib.util.find_spec("pyarrow") is None:
+        return "str" if int(pd.__version__.split(".")[0]) >= 3 else object
+    try:
+        return pd.StringDtype("pyarrow", na_value=np.nan)
+    except TypeError:  # pandas < 2.3
+        try:
+            return pd.StringDtype("pyarrow_numpy")
+        except ValueError:  # pandas < 2.1
+            return object
+
+TYPE_TEXTE = _type_texte()
+# dtypes pour read_csv : texte et catégories lus directement, le reste converti par appliquer_schema
+LECTURE_DTYPES = {c: (TYPE_TEXTE if t == "str" else t) for c, t in SCHEMA.items() if t in ("category", "str")}
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S.%f"
+
+# Champs modifiables après coup (Indice_Etat est recalculé)
+EDITABLE_COLS = ["Commentaire"] + RATING_COLS
+
+# Soumission identique à une évaluation de moins de FENETRE_DOUBLON : refusée (double
+# clic, renvoi) ; au-delà, c'est peut-être une ré-inspection identique, à confirmer
+FENETRE_DOUBLON = pd.Timedelta(days=1)
+# Champs comparés pour reconnaître une soumission identique (ni ID, ni date, ni photos)
+EMPREINTE_COLS = ["Nom", "Pont", "Ville", "Type_pont", "Etat_tablier", "Commentaire"] + RATING_COLS
+
+# Mode hors mémoire : nombre d'évaluations (estimé par le stockage) au-delà duquel
+# le jeu n'est plus chargé en DataFrame ; réglable par variable d'environnement
+SEUIL_HORS_MEMOIRE = int(os.environ.get("SEUIL_HORS_MEMOIRE", 2_000_000))
+BLOC_LECTURE = 100_000  # évaluations par bloc en lecture en flux
+
+# Bornes des coordonnées (degrés décimaux)
+BORNES_COORD = {"Latitude": 90, "Longitude": 180}
+
+TYPES_PONT = ["Pont en béton", "Pont métallique", "Pont mixte", "Pont en bois", "Autre"]
+ETATS_TABLIER = ["Très Bon", "Bon", "Moyen", "Mauvais", "Très Mauvais"]
+
+# -----------------------
+# Helpers
+# -----------------------
+def _parse_dates(s):
+    try:
+        return pd.to_datetime(s, errors="coerce", format="ISO8601")
+    except (TypeError, ValueError):
+        # pandas < 2 : pas de format "ISO8601"
+        return pd.to_datetime(s, errors="coerce")
+
+def nombres(s):
+    # Texte -> nombres, virgule décimale acceptée ("3,85") ; NaN si illisible
+    return pd.to_numeric(s.astype(str).str.strip().str.replace(",", ".", regex=False), errors="coerce")
+
+def lire_coordonnee(texte, col):
+    """Coordonnée saisie : NaN si vide, ValueError si illisible ou hors bornes (jamais de NaN silencieux)."""
+    texte = str(texte or "").strip()
+    if not texte:
+        return np.nan
+    val = nombres(pd.Series([texte])).iloc[0]
+    if pd.isna(val) or abs(val) > BORNES_COORD[col]:
+        raise ValueError(f"{col} invalide : « {texte} » (degrés décimaux entre -{BORNES_COORD[col]} et {BORNES_COORD[col]}, ex. 3,85)")
+    return float(val)
+
+def appliquer_schema(df):
+    # Convertit un DataFrame (lu en str, concaténé...) vers SCHEMA
+    df = df.reindex(columns=COLUMNS)
+    out = {}
+    for col, dtype in SCHEMA.items():
+        s = df[col]
+        if dtype == "datetime64[ns]":
+            s = s if pd.api.types.is_datetime64_any_dtype(s) else _parse_dates(s)
+        elif dtype == "Int8":
+            s = pd.to_numeric(s, errors="coerce").round().astype("Int8")
+        elif dtype in ("float32", "float64"):
+            s = pd.to_numeric(s, errors="coerce").astype(dtype)
+        elif dtype == "category":
+            s = s.astype("category")
+        elif TYPE_TEXTE is object:
+            s = s.astype(object).where(s.notna(), np.nan)
+        else:
+            s = s.astype(TYPE_TEXTE)
+        out[col] = s
+    return pd.DataFrame(out, index=df.index)
+
+def load_data(stockage=None):
+    # Toutes les évaluations, corrections appliquées
+    if stockage is None:
+        from stockage import get_stockage
+        stockage = get_stockage()
+    brut, corrections, _ = stockage.lire_evaluations()
+    return appliquer_corrections(appliquer_schema(brut).reset_index(drop=True), corrections)
+
+def hors_memoire(stockage=None):
+    if stockage is None:
+        from stockage import get_stockage
+        stockage = get_stockage()
+    return stockage.volume_evaluations() > SEUIL_HORS_MEMOIRE
+
+def lire_par_blocs(stockage=None, taille=BLOC_LECTURE, **filtres):
+    """Évaluations par blocs au SCHEMA, corrections appliquées (filtres : voir masque_filtres)."""
+    if stockage is None:
+        from stockage import get_stockage
+        stockage = get_stockage()
+    corrections = stockage.corrections_evaluations()
+    for brut in stockage.evaluations_par_blocs(taille):
+        bloc = appliquer_corrections(appliquer_schema(brut).reset_index(drop=True), corrections)
+        if any(v is not None for v in filtres.values()):
+            bloc = bloc[masque_filtres(bloc, **filtres)]
+        if len(bloc):
+            yield bloc
+
+def charger_filtre(stockage=None, **filtres):
+    # Sous-ensemble filtré (un pont, une ville...) lu en flux puis réuni : seul le résultat est en mémoire
+    blocs = list(lire_par_blocs(stockage, **filtres))
+    df = pd.concat(blocs, ignore_index=True) if blocs else pd.DataFrame(columns=COLUMNS)
+    return appliquer_schema(df)  # catégories réunies d'un bloc à l'autre
+
+def masque_filtres(df, ville=None, type_pont=None, etat=None, pont=None, nom=None, date_min=None, date_max=None,
+                   texte=None):
+    # Filtres du tableau de bord (None = pas de filtre), sur un jeu complet ou un bloc ;
+    # `texte` : requête plein texte sur les commentaires, sans index (voir Evaluations.rechercher)
+    mask = np.ones(len(df), dtype=bool)
+    for col, val in (("Ville", ville), ("Type_pont", type_pont), ("Etat_tablier", etat), ("Pont", pont)):
+        if val is not None:
+            mask &= (df[col] == val).to_numpy(dtype=bool, na_value=False)
+    if nom is not None:
+        mask &= (_normaliser_noms(df["Nom"]) == normaliser_nom(nom)).to_numpy()
+    if date_min:
+        mask &= (df["Timestamp"] >= pd.Timestamp(date_min)).to_numpy()
+    if date_max:
+        mask &= (df["Timestamp"] < pd.Timestamp(date_max) + pd.Timedelta(days=1)).to_numpy()
+    if texte:
+        # seulement sur les lignes retenues par les autres filtres
+        retenues = np.flatnonzero(mask)
+        mask[retenues] = masque_texte(df["Commentaire"].iloc[retenues], texte)
+    return mask
+
+def compute_index(row):
+    # Notes expected 1..5
+    try:
+        scores = np.array([float(row.get(c, 0)) for c in RATING_COLS])
+        # Normalize if missing values
+        mask = ~np.isnan(scores)
+        if mask.sum() == 0:
+            return 0.0
+        w = RATING_WEIGHTS[mask]
+        s = scores[mask]
+        idx = float((s * w).sum() / w.sum())
+        return round(idx, 2)
+    except Exception:
+        return 0.0
+
+def compute_index_frame(df):
+    # Même calcul que compute_index, vectorisé sur tout un DataFrame
+    scores = df[RATING_COLS].apply(pd.to_numeric, errors="coerce").astype("float64").to_numpy()
+    mask = ~np.isnan(scores)
+    w = np.where(mask, RATING_WEIGHTS, 0.0)
+    total_w = w.sum(axis=1)
+    num = np.where(mask, scores, 0.0) @ RATING_WEIGHTS
+    with np.errstate(invalid="ignore", divide="ignore"):
+        idx = np.where(total_w > 0, num / total_w, 0.0)
+    return pd.Series(np.round(idx, 2), index=df.index, name="Indice_Etat")
+
+
+# -----------------------
+# Corrections & index par évaluateur
+# -----------------------
+def empreinte_ligne(row):
+    return empreinte([("" if pd.isna(row[c]) else int(row[c])) if c in RATING_COLS else row[c]
+                      for c in EMPREINTE_COLS])
+
+def normaliser_nom(nom):
+    return " ".join(str(nom).split()).lower()
+
+def _normaliser_noms(s):
+    return s.astype(str).str.split().str.join(" ").str.lower()
+
+def appliquer_corrections(df, corrections, positions=None):
+    # Dernière valeur par (ID, Champ) ; modifie df en place et le renvoie
+    if corrections.empty or df.empty:
+        return df
+    positions = pd.Index(df["ID"]) if positions is None else positions
+    dernieres = corrections.drop_duplicates(["ID", "Champ"], keep="last")
+    for champ, grp in dernieres.groupby("Champ"):
+        if champ not in EDITABLE_COLS + ["Indice_Etat"]:
+            continue
+        pos = positions.get_indexer(grp["ID"])
+        ok = pos >= 0
+        if not ok.any():
+            continue
+        valeurs = grp["Valeur"].to_numpy()[ok]
+        if champ in RATING_COLS or champ == "Indice_Etat":
+            valeurs = pd.to_numeric(pd.Series(valeurs), errors="coerce").astype(SCHEMA[champ]).array
+        df.iloc[pos[ok], df.columns.get_loc(champ)] = valeurs
+    return df
+
+
+def _cles_tri(s):
+    # Clés numériques dans l'ordre de sort_values (manquants en dernier) ; None si non prévu
+    manquants = s.isna().to_numpy()
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        return np.where(manquants, len(s.cat.categories), s.cat.codes.to_numpy())
+    if pd.api.types.is_datetime64_any_dtype(s):
+        return np.where(manquants, np.iinfo("int64").max, s.to_numpy().view("int64"))
+    if pd.api.types.is_numeric_dtype(s):
+        return np.where(manquants, np.inf, s.to_numpy(dtype="float64", na_value=np.nan))
+    return None
+
+def _dater_doublon(dup, row, autre):
+    # Doublon exact d'une évaluation ancienne : type "ancien" (ré-inspection identique, à confirmer)
+    if dup is None or dup.type != "exact":
+        return dup
+    ecart = abs(pd.Timestamp(row["Timestamp"]) - pd.Timestamp(autre["Timestamp"]))
+    return dup if pd.isna(ecart) or ecart <= FENETRE_DOUBLON else dup._replace(type="ancien")
+
+
+class Evaluations:
+    """Évaluations chargées une fois, avec index ID → ligne et évaluateur → IDs.
+
+    Les ajouts et les corrections passent par le stockage sans réécrire le jeu
+    de données ; `synchroniser()` ne relit que ce qui a changé depuis le
+    dernier appel (dans cette session ou dans un autre processus).
+    """
+
+    hors_memoire = False
+
+    def __init__(self, stockage=None):
+        if stockage is None:
+            from stockage import get_stockage
+            stockage = get_stockage()
+        self.stockage = stockage
+        self._verrou = threading.RLock()
+        self._generation = 0
+        self.recharger()
+
+    # --- chargement ---
+    def recharger(self):
+        with self._verrou:
+            brut, corrections, self._curseur = self.stockage.lire_evaluations()
+            self.df = appliquer_schema(brut).reset_index(drop=True)
+            self._ordres = {}
+            self._texte = None  # construit à la première recherche
+            self._construire_index()
+            appliquer_corrections(self.df, corrections, self.positions)
+            # index des doublons construit en arrière-plan, hors verrou (voir _preparer_doublons)
+            self._generation += 1
+            if getattr(self, "_doublons_pret", None) is not None:
+                self._doublons_pret.set()  # réveille qui attend l'ancien index : il relira le nouvel état
+            self._doublons = None
+            self._doublons_attente = set()  # IDs ajoutés / corrigés pendant la construction
+            self._doublons_pret = threading.Event()
+            threading.Thread(target=self._preparer_doublons, args=(self._generation,),
+                             name="doublons", daemon=True).start()
+
+    def _construire_index(self):
+        self.positions = pd.Index(self.df["ID"])
+        ordre = self.df.assign(_cle=_normaliser_noms(self.df["Nom"])).sort_values("Timestamp", kind="stable")
+        self.par_evaluateur = {k: list(v) for k, v in ordre.groupby("_cle", sort=False)["ID"]}
+
+    def synchroniser(self):
+        # Relit uniquement les lignes ajoutées / corrections écrites depuis le dernier appel
+        with self._verrou:
+            suite = self.stockage.evaluations_depuis(self._curseur)
+            if suite is None:
+                # CSV compacté alors que ce lecteur était en retard : rechargement complet
+                self.recharger()
+                return self.df
+            nouvelles, corrections, self._curseur = suite
+            if not nouvelles.empty:
+                self._ajouter_en_memoire(nouvelles)
+            if not corrections.empty:
+                appliquer_corrections(self.df, corrections, self.positions)
+                self._indexer_doublons(corrections["ID"].unique())
+                self._indexer_texte(corrections.loc[corrections["Champ"] == "Commentaire", "ID"].unique())
+                # les corrections ne touchent pas Timestamp
+                self._ordres = {c: o for c, o in self._ordres.items() if c == "Timestamp"}
+            return self.df
+
+    def _ajouter_en_memoire(self, nouvelles):
+        nouvelles = appliquer_schema(nouvelles)
+        # une même ligne peut être relue (fenêtre de relecture des backends SQL)
+        nouvelles = nouvelles[~nouvelles["ID"].isin(self.positions)].copy()
+        if nouvelles.empty:
+            return
+        if len(self.df):
+            # seules les nouvelles lignes sont converties ; catégories alignées pour que concat les garde
+            # catégories gardées triées : le tri par catégorie (ordre()) reste alphabétique
+            for col, dtype in SCHEMA.items():
+                if dtype == "category":
+                    cats = self.df[col].cat.categories.union(nouvelles[col].cat.categories)
+                    if len(cats) > len(self.df[col].cat.categories):
+                        self.df[col] = self.df[col].cat.set_categories(cats)
+                    nouvelles[col] = nouvelles[col].cat.set_categories(self.df[col].cat.categories)
+            debut = len(self.df)
+            self.df = pd.concat([self.df, nouvelles], ignore_index=True)
+            self.positions = self.positions.append(pd.Index(nouvelles["ID"]))
+            self._inserer_dans_ordres(debut)
+        else:
+            self.df = nouvelles.reset_index(drop=True)
+            self.positions = pd.Index(self.df["ID"])
+            self._ordres = {}
+        for cle, id_ in zip(_normaliser_noms(nouvelles["Nom"]), nouvelles["ID"]):
+            self.par_evaluateur.setdefault(cle, []).append(id_)
+        self._indexer_doublons(nouvelles["ID"])
+        self._indexer_texte(nouvelles["ID"])
+
+    # --- lecture ---
+    def version(self):
+        # Change à chaque ajout ou correction lu : sert de clé de cache (exports)
+        return self._curseur
+
+    def evaluations_de(self, nom):
+        return list(self.par_evaluateur.get(normaliser_nom(nom), []))
+
+    def derniere_evaluation(self, nom):
+        ids = self.par_evaluateur.get(normaliser_nom(nom))
+        return ids[-1] if ids else None
+
+    def ligne(self, id_):
+        return self.df.iloc[self.positions.get_loc(id_)]
+
+    def ordre(self, colonne="Timestamp"):
+        # Positions triées par `colonne` (croissant, valeurs manquantes à la fin), en cache
+        with self._verrou:
+            if colonne not in self._ordres:
+                self._ordres[colonne] = self.df.sort_values(colonne, kind="stable", na_position="last").index.to_numpy()
+            return self._ordres[colonne]
+
+    def trier(self, colonne="Timestamp"):
+        # (df, ordre(colonne)) lus ensemble : un ajout concurrent ne peut pas les désaccorder
+        with self._verrou:
+            return self.df, self.ordre(colonne)
+
+    def _inserer_dans_ordres(self, debut):
+        # Lignes `debut`.. insérées à leur rang dans les ordres en cache, sans retrier :
+        # après l'existant à valeur égale, comme le tri stable
+        for colonne, ordre in list(self._ordres.items()):
+            cles = _cles_tri(self.df[colonne])
+            if cles is None:
+                del self._ordres[colonne]
+                continue
+            nouvelles = debut + np.argsort(cles[debut:], kind="stable")
+            rangs = np.searchsorted(cles[ordre], cles[nouvelles], side="right")
+            self._ordres[colonne] = np.insert(ordre, rangs, nouvelles)
+
+    # --- doublons ---
+    def _preparer_doublons(self, generation):
+        with self._verrou:
+            df = self.df[["ID"] + EMPREINTE_COLS]
+        index = IndexDoublons()
+        for r in df.itertuples(index=False):
+            r = r._asdict()
+            index.ajouter(r["ID"], empreinte_ligne(r), r["Commentaire"])
+        with self._verrou:
+            if generation != self._generation:
+                return  # rechargé entre-temps : une autre construction est en cours
+            self._doublons = index
+            attente, self._doublons_attente = self._doublons_attente, None
+            self._indexer_doublons(attente)
+            self._doublons_pret.set()
+
+    def _indexer_doublons(self, ids):
+        if self._doublons is None:
+            self._doublons_attente.update(ids)
+            return
+        for id_ in ids:
+            if id_ in self.positions:
+                r = self.ligne(id_)
+                self._doublons.ajouter(id_, empreinte_ligne(r), r["Commentaire"])
+
+    def doublon(self, row, exclure=None):
+        """Évaluation identique ou au commentaire quasi identique à `row` (doublons.Doublon), ou None."""
+        while True:
+            with self._verrou:
+                self.synchroniser()
+                if self._doublons is not None:
+                    dup = self._doublons.chercher(empreinte_ligne(row), row.get("Commentaire"), exclure)
+                    return _dater_doublon(dup, row, self.ligne(dup.id) if dup is not None else None)
+                pret = self._doublons_pret
+            # construction en cours : attente hors verrou, puis nouvel essai (un rechargement
+            # entre-temps remplace l'index et réveille cette attente)
+            pret.wait()
+
+    # --- recherche plein texte ---
+    def _indexer_texte(self, ids):
+        if self._texte is None:
+            return
+        col = self.df.columns.get_loc("Commentaire")
+        for id_ in ids:
+            if id_ in self.positions:
+                pos = self.positions.get_loc(id_)
+                self._texte.ajouter(pos, self.df.iat[pos, col])
+
+    def rechercher(self, requete, mask=None, k=None):
+        """[(position, score)] des évaluations dont le commentaire répond à `requete` (voir recherche.py)."""
+        with self._verrou:
+            self.synchroniser()
+            if self._texte is None:
+                self._texte = IndexTexte()
+                for pos, txt in enumerate(self.df["Commentaire"].tolist()):
+                    self._texte.ajouter(pos, txt)
+            candidats = None if mask is None else np.flatnonzero(mask).tolist()
+            return self._texte.chercher(requete, candidats, k)
+
+    # --- écriture ---
+    def ajouter(self, row):
+        # Ajoute une évaluation (ajout en fin de stockage, sans réécriture)
+        with self._verrou:
+            self.stockage.ajouter_evaluations(appliquer_schema(pd.DataFrame([row])))
+            self.synchroniser()
+            return row["ID"]
+
+    def modifier(self, id_, **champs):
+        """Modifie une évaluation par ID (commentaire et/ou notes)."""
+        with self._verrou:
+            self.synchroniser()
+            if id_ not in self.positions:
+                raise KeyError(id_)
+            champs = _valider_correction(champs, self.ligne(id_))
+            self.stockage.corriger_evaluation(id_, champs)
+            self.synchroniser()
+            return self.ligne(id_)
+
+
+def _valider_correction(champs, actuelle):
+    # Champs d'une modification, contrôlés, avec Indice_Etat recalculé si une note change
+    inconnus = set(champs) - set(EDITABLE_COLS)
+    if inconnus:
+        raise ValueError(f"Champs non modifiables : {sorted(inconnus)}")
+    for c in RATING_COLS:
+        if c in champs and not 1 <= int(champs[c]) <= 5:
+            raise ValueError(f"{c} doit être entre 1 et 5.")
+    if "Commentaire" in champs:
+        champs["Commentaire"] = str(champs["Commentaire"]).strip()
+        if not champs["Commentaire"]:
+            raise ValueError("Le commentaire ne peut pas être vide.")
+    if any(c in champs for c in RATING_COLS):
+        notes = {c: champs.get(c, actuelle[c]) for c in RATING_COLS}
+        champs["Indice_Etat"] = compute_index({c: (np.nan if pd.isna(v) else float(v)) for c, v in notes.items()})
+    return champs
+
+
+class EvaluationsArchive:
+    """Évaluations d'un gros volume, jamais chargées en entier (mode hors mémoire).
+
+    Même interface que Evaluations pour le formulaire ; les agrégats et les
+    exports passent par lire_par_blocs. Les évaluations d'une personne sont
+    retrouvées par lecture en flux (puis gardées en cache) ; les doublons ne
+    sont cherchés que parmi les évaluations reçues depuis le démarrage.
+    """
+
+    hors_memoire = True
+
+    def __init__(self, stockage=None):
+        if stockage is None:
+            from stockage import get_stockage
+            stockage = get_stockage()
+        self.stockage = stockage
+        self._verrou = threading.RLock()
+        self._vider()
+
+    def _vider(self):
+        self._curseur = self.stockage.curseur_evaluations()
+        self._recentes = {}  # ID -> ligne (dict), reçues depuis le démarrage
+        self._doublons = IndexDoublons()
+        self._evaluateur = None  # clé du nom de la dernière personne lue
+        self._lignes = {}  # ID -> ligne (dict) de ses évaluations, par date
+
+    def synchroniser(self):
+        # Nouvelles lignes et corrections : index des doublons et cache de l'évaluateur à jour
+        with self._verrou:
+            suite = self.stockage.evaluations_depuis(self._curseur)
+            if suite is None:
+                self._vider()  # CSV compacté alors que ce lecteur était en retard
+                return
+            nouvelles, corrections, self._curseur = suite
+            modifiees = set()
+            for r in appliquer_schema(nouvelles).to_dict("records"):
+                if r["ID"] not in self._recentes:
+                    self._recentes[r["ID"]] = r
+                    modifiees.add(r["ID"])
+                    if normaliser_nom(r["Nom"]) == self._evaluateur:
+                        self._lignes[r["ID"]] = r
+            for r in corrections.drop_duplicates(["ID", "Champ"], keep="last").itertuples(index=False):
+                if r.Champ not in EDITABLE_COLS + ["Indice_Etat"]:
+                    continue
+                valeur = r.Valeur if r.Champ == "Commentaire" else pd.to_numeric(r.Valeur, errors="coerce")
+                for lignes in (self._recentes, self._lignes):
+                    if r.ID in lignes:
+                        lignes[r.ID][r.Champ] = valeur
+                modifiees.add(r.ID)
+            for id_ in modifiees & self._recentes.keys():
+                ligne = self._recentes[id_]
+                self._doublons.ajouter(id_, empreinte_ligne(ligne), ligne["Commentaire"])
+
+    # --- lecture ---
+    def version(self):
+        return self._curseur
+
+    def evaluations_de(self, nom):
+        # Une lecture en flux filtrée sur le nom, puis cache tenu à jour par synchroniser()
+        with self._verrou:
+            self.synchroniser()
+            cle = normaliser_nom(nom)
+            if cle != self._evaluateur:
+                df = charger_filtre(self.stockage, nom=nom).sort_values("Timestamp", kind="stable")
+                self._lignes = {r["ID"]: r for r in df.to_dict("records")}
+                # lignes reçues pendant la lecture : déjà dans _recentes
+                self._lignes.update((i, r) for i, r in self._recentes.items() if normaliser_nom(r["Nom"]) == cle)
+                self._evaluateur = cle
+            return list(self._lignes)
+
+    def derniere_evaluation(self, nom):
+        ids = self.evaluations_de(nom)
+        return ids[-1] if ids else None
+
+    def ligne(self, id_):
+        for lignes in (self._lignes, self._recentes):
+            if id_ in lignes:
+                return pd.Series(lignes[id_])
+        for bloc in lire_par_blocs(self.stockage):
+            trouvee = bloc[bloc["ID"] == id_]
+            if len(trouvee):
+                return trouvee.iloc[-1]
+        raise KeyError(id_)
+
+    # --- doublons ---
+    def doublon(self, row, exclure=None):
+        """Comme Evaluations.doublon, parmi les évaluations reçues depuis le démarrage."""
+        with self._verrou:
+            self.synchroniser()
+            dup = self._doublons.chercher(empreinte_ligne(row), row.get("Commentaire"), exclure)
+            return _dater_doublon(dup, row, self.ligne(dup.id) if dup is not None else None)
+
+    # --- écriture ---
+    def ajouter(self, row):
+        with self._verrou:
+            self.stockage.ajouter_evaluations(appliquer_schema(pd.DataFrame([row])))
+            self.synchroniser()
+            return row["ID"]
+
+    def modifier(self, id_, **champs):
+        with self._verrou:
+            champs = _valider_correction(champs, self.ligne(id_))
+            self.stockage.corriger_evaluation(id_, champs)
+            self.synchroniser()
+            return self.ligne(id_)
@@ -0,0 +1,230 @@
+# rapports_pdf.py
+# Rapports PDF des évaluations de ponts : graphiques, rapport d'un pont (ou
+# d'un ensemble filtré) et génération en lot, un rapport par pont pour une
+# ville ou tout le réseau, livrés dans un seul ZIP.
+#
+# Le lot est rendu dans un pool de processus (matplotlib n'est pas
+# thread-safe) ; les graphiques communs (contexte de la ville / du réseau)
+# sont rendus une seule fois en PNG et réutilisés dans chaque rapport.
+#
+#   python rapports_pdf.py rapports_reseau.zip
+#   python rapports_pdf.py rapports_yaounde.zip --ville Yaoundé --processus 8
+import argparse
+import multiprocessing
+import os
+import re
+import sys
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from io import BytesIO
+
+import pandas as pd
+
+import matplotlib
+import matplotlib.pyplot as plt
+from matplotlib.backends.backend_pdf import PdfPages
+
+from pont_donnees import RATING_COLS, charger_filtre, hors_memoire, load_data
+from stockage import get_stockage
+
+# -----------------------
+# Charts
+# -----------------------
+def make_pie_chart(df, col, title):
+    return make_pie_counts(df[col].value_counts(), title)
+
+def make_pie_counts(counts, title):
+    # counts: value_counts() or a snapshot count table (see syntheses.py)
+    counts = counts[counts > 0]  # catégories absentes du filtre
+    if counts.empty:
+        return None
+    colors = ["#4CAF50", "#FFC107", "#F44336", "#2196F3", "#9C27B0"]  # nice palette
+    fig, ax = plt.subplots(figsize=(5,5))
+    ax.pie(counts, labels=counts.index, autopct='%1.1f%%', colors=colors[:len(counts)], startangle=90)
+    ax.set_title(title)
+    plt.tight_layout()
+    return fig
+
+def make_bar_ratings(df, rating_cols, title):
+    if df.empty:
+        return None
+    return make_bar_means(df[rating_cols].astype("float32").mean(), title)
+
+def make_bar_means(means, title):
+    if means.isna().all():
+        return None
+    fig, ax = plt.subplots(figsize=(6,4))
+    bars = ax.bar(means.index, means.values, color=["#1f77b4","#ff7f0e","#2ca02c","#d62728"], alpha=0.9)
+    ax.set_ylim(0,5)
+    ax.set_ylabel("Moyenne (1-5)")
+    ax.set_title(title)
+    for bar in bars:
+        ax.text(bar.get_x() + bar.get_width()/2, bar.get_height()+0.05, f"{bar.get_height():.2f}", ha='center')
+    plt.tight_layout()
+    return fig
+
+def figure_png(fig, dpi=100):
+    buf = BytesIO()
+    fig.savefig(buf, format="png", dpi=dpi)
+    plt.close(fig)
+    return buf.getvalue()
+
+# -----------------------
+# Report
+# -----------------------
+def generate_pdf_report(selected_df, bridge_name=None, context=None, stockage=None):
+    # context: [(title, png bytes)] rendered once and shared by a batch of reports
+    stockage = stockage or get_stockage()
+    buf = BytesIO()
+    with PdfPages(buf) as pdf:
+        # Page 1: Summary text
+        fig_text = plt.figure(figsize=(8.27, 11.69))  # A4
+        fig_text.clf()
+        fig_text.text(0.01, 0.95, "Rapport - Analyse des évaluations", fontsize=18, weight='bold')
+        now = datetime.now().strftime("%Y-%m-%d %H:%M")
+        fig_text.text(0.01, 0.92, f"Date: {now}", fontsize=10)
+        if bridge_name:
+            fig_text.text(0.01, 0.88, f"Pont: {bridge_name}", fontsize=12)
+        fig_text.text(0.01, 0.84, f"Nombre d'évaluations incluses: {len(selected_df)}", fontsize=12)
+        pdf.savefig(fig_text)
+        plt.close(fig_text)
+
+        # Page 2: Pie chart of states
+        fig1 = make_pie_chart(selected_df, "Etat_tablier", "Répartition des états (tabliers)")
+        if fig1:
+            pdf.savefig(fig1); plt.close(fig1)
+
+        # Page 3: Bar ratings
+        rating_cols = ["Note_Securite","Note_Deformation","Note_Corrosion","Note_Tablier"]
+        if not selected_df.empty and all(c in selected_df.columns for c in rating_cols):
+            fig2 = make_bar_ratings(selected_df, rating_cols, "Moyennes des notes (1-5)")
+            if fig2:
+                pdf.savefig(fig2); plt.close(fig2)
+
+        # Shared context pages (city / network), already rendered
+        for title, png in context or []:
+            ctx_fig = plt.figure(figsize=(8.27, 6))
+            plt.imshow(plt.imread(BytesIO(png)))
+            plt.axis('off')
+            plt.title(title)
+            pdf.savefig(ctx_fig)
+            plt.close(ctx_fig)
+
+        # Page 4+: Individual photos (first 6)
+        photos = []
+        for p in selected_df.get("Photos", pd.Series(dtype=str)).dropna().unique():
+            for fname in str(p).split(";"):
+                if fname:
+                    photos.append(fname)
+        # Limit to first 8 photos
+        for photo in photos[:8]:
+            contenu = stockage.lire_photo(photo)
+            if contenu is not None:
+                try:
+                    img_fig = plt.figure(figsize=(8.27, 6))
+                    img = plt.imread(BytesIO(contenu))
+                    plt.imshow(img)
+                    plt.axis('off')
+                    pdf.savefig(img_fig)
+                    plt.close(img_fig)
+                except Exception:
+                    pass
+    buf.seek(0)
+    return buf
+
+
+# -----------------------
+# Lot : un rapport par pont, dans un ZIP
+# -----------------------
+def contexte_commun(df, portee):
+    """Graphiques de la ville / du réseau, rendus une fois pour tout le lot."""
+    context = []
+    fig = make_pie_chart(df, "Etat_tablier", f"Répartition des états — {portee}")
+    if fig:
+        context.append((f"Contexte : {portee}", figure_png(fig)))
+    fig = make_bar_ratings(df, RATING_COLS, f"Moyennes des notes — {portee}")
+    if fig:
+        context.append((f"Contexte : {portee}", figure_png(fig)))
+    return context
+
+_lot = None  # (évaluations, contexte) du lot, chargés une fois par worker (voir _init_worker)
+
+def _init_worker(chemin, context):
+    global _lot
+    matplotlib.use("Agg")  # workers du pool : pas d'affichage
+    _lot = pd.read_pickle(chemin), context
+
+def _rapport_pont(tache):
+    # tâche = (nom du pont, positions de ses évaluations) : les données du lot sont déjà dans le worker
+    nom, positions = tache
+    df, context = _lot
+    return generate_pdf_report(df.iloc[positions], bridge_name=nom, context=context).getvalue()
+
+def _nom_fichier(nom, pris):
+    base = re.sub(r"[^\w\-]+", "_", str(nom)).strip("_") or "pont"
+    nom_f, i = base, 1
+    while nom_f in pris:
+        i += 1
+        nom_f = f"{base}_{i}"
+    pris.add(nom_f)
+    return f"{nom_f}.pdf"
+
+def generer_lot(df, dest, ville=None, processus=None, progression=None):
+    """Écrit dans `dest` (chemin ou fichier binaire) un ZIP d'un PDF par pont ; renvoie le nombre de rapports."""
+    if ville is not None:
+        df = df[df["Ville"] == ville]
+    df = df[df["Pont"].notna()].reset_index(drop=True)
+    portee = ville or "réseau complet"
+    context = contexte_commun(df, portee)
+    # un pont = (ville, nom) : deux villes peuvent avoir un pont du même nom
+    groupes = df.groupby([df["Ville"].astype(object).fillna(""), "Pont"], sort=True, observed=True)
+    cles = sorted(groupes.indices)
+    taches = [(nom, groupes.indices[(v, nom)]) for v, nom in cles]
+    fichiers = [nom if ville is not None else f"{v}_{nom}" for v, nom in cles]
+    if not taches:
+        return 0
+
+    processus = processus or os.cpu_count() or 1
+    # spawn : un fork depuis le serveur Streamlit (multi-thread) peut bloquer
+    ctx = multiprocessing.get_context("spawn")
+    pris = set()
+    # évaluations et contexte transmis une fois par worker (fichier temporaire + initializer),
+    # pas dans chaque tâche
+    fd, chemin = tempfile.mkstemp(prefix=".lot_", suffix=".pkl")
+    os.close(fd)
+    try:
+        df.to_pickle(chemin)
+        # PDF déjà compressés : stockés tels quels dans le ZIP
+        with zipfile.ZipFile(dest, "w", compression=zipfile.ZIP_STORED) as zf, \
+                ProcessPoolExecutor(max_workers=min(processus, len(taches)), mp_context=ctx,
+                                    initializer=_init_worker, initargs=(chemin, context)) as pool:
+            pdfs = pool.map(_rapport_pont, taches, chunksize=max(1, len(taches) // (processus * 8)))
+            for i, (fichier, pdf) in enumerate(zip(fichiers, pdfs), 1):
+                zf.writestr(_nom_fichier(fichier, pris), pdf)
+                if progression:
+                    progression(i, len(taches))
+    finally:
+        os.remove(chemin)
+    return len(taches)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rapports PDF par pont, en lot, dans un ZIP.")
+    parser.add_argument("dest", help="fichier .zip à écrire")
+    parser.add_argument("--ville", default=None, help="une seule ville (défaut : tout le réseau)")
+    parser.add_argument("--processus", type=int, default=None, help="processus de rendu (défaut : nombre de cœurs)")
+    args = parser.parse_args(argv)
+
+    t0 = time.perf_counter()
+    # gros volume : seules les évaluations du périmètre sont lues (en flux)
+    df = charger_filtre(ville=args.ville) if hors_memoire() else load_data()
+    n = generer_lot(df, args.dest, ville=args.ville, processus=args.processus)
+    print(f"{n} rapports écrits dans {args.dest} en {time.perf_counter() - t0:.1f} s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
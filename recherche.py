@@ -0,0 +1,193 @@
+# recherche.py
+# Recherche plein texte dans les commentaires d'inspection : index inversé
+# terme -> évaluations -> positions du terme dans le commentaire, insensible à
+# la casse et aux accents (même normalisation que doublons.py), mis à jour à
+# chaque ajout ou modification.
+#
+# Une requête mêle mots-clés et expressions entre guillemets :
+#   corrosion "fissures longitudinales" appuis
+# Les expressions sont obligatoires (mots consécutifs) ; sans expression, il
+# suffit d'un mot-clé. Les résultats sont classés par score BM25.
+import heapq
+import math
+import re
+import threading
+from operator import itemgetter
+
+import numpy as np
+import pandas as pd
+
+from doublons import normaliser_texte
+
+# BM25
+K1 = 1.2
+B = 0.75
+# Ignorés comme mots-clés (ils restent dans les expressions)
+MOTS_VIDES = frozenset("a au aux avec ce ces dans de des du en est et il la le les leur ne ou par pas "
+                       "pour qu que qui sa se son sont sur un une".split())
+
+
+def tokeniser(texte):
+    return normaliser_texte(texte).split()
+
+def analyser(requete):
+    """(mots-clés, expressions) d'une requête ; une expression est une liste de termes."""
+    expressions = [tokeniser(e) for e in re.findall(r'"([^"]*)"', requete)]
+    mots = [t for t in tokeniser(re.sub(r'"[^"]*"', " ", requete)) if t not in MOTS_VIDES]
+    return list(dict.fromkeys(mots)), [e for e in expressions if e]
+
+
+class IndexTexte:
+    """Index inversé de textes courts, identifiés par une clé quelconque (position, ID)."""
+
+    def __init__(self):
+        self._verrou = threading.Lock()
+        self._postings = {}  # terme -> {doc: [positions]}
+        self._termes = {}  # doc -> termes distincts (pour retirer l'ancienne version)
+        self._longueurs = {}  # doc -> nombre de termes
+        self._total = 0
+
+    def __len__(self):
+        return len(self._longueurs)
+
+    def ajouter(self, doc, texte):
+        """Indexe (ou réindexe, après une modification) le texte de `doc`."""
+        positions = {}
+        for i, t in enumerate(tokeniser(texte)):
+            positions.setdefault(t, []).append(i)
+        with self._verrou:
+            self._retirer(doc)
+            for t, p in positions.items():
+                self._postings.setdefault(t, {})[doc] = p
+            self._termes[doc] = tuple(positions)
+            self._longueurs[doc] = n = sum(len(p) for p in positions.values())
+            self._total += n
+
+    def _retirer(self, doc):
+        for t in self._termes.pop(doc, ()):
+            post = self._postings[t]
+            del post[doc]
+            if not post:
+                del self._postings[t]
+        self._total -= self._longueurs.pop(doc, 0)
+
+    def _expression(self, termes):
+        # Docs contenant les termes consécutifs, en partant de la liste la plus courte
+        listes = [self._postings.get(t) for t in termes]
+        if not all(listes):
+            return set()
+        docs = set.intersection(*sorted((set(p) for p in listes), key=len))
+        if len(termes) == 1:
+            return docs
+        return {d for d in docs
+                if any(all(p + i in listes[i][d] for i in range(1, len(termes))) for p in listes[0][d])}
+
+    def chercher(self, requete, candidats=None, k=None):
+        """[(doc, score)] par score décroissant ; `candidats` : docs autorisés (filtres), ou None."""
+        mots, expressions = analyser(requete)
+        if not mots and not expressions:
+            return []
+        with self._verrou:
+            n = len(self._longueurs)
+            if n == 0:
+                return []
+            requis = None if candidats is None else set(candidats)
+            for e in expressions:
+                docs = self._expression(e)
+                requis = docs if requis is None else requis & docs
+            moyenne = self._total / n or 1.0
+            scores = {}
+            for t in dict.fromkeys(mots + [t for e in expressions for t in e]):
+                post = self._postings.get(t)
+                if not post:
+                    continue
+                idf = math.log(1 + (n - len(post) + 0.5) / (len(post) + 0.5))
+                # terme fréquent (mot vide d'une expression) : on parcourt les seuls docs retenus
+                docs = post if requis is None or len(post) <= len(requis) else (d for d in requis if d in post)
+                for d in docs:
+                    if requis is not None and d not in requis:
+                        continue
+                    tf = len(post[d])
+                    s = idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * self._longueurs[d] / moyenne))
+                    scores[d] = scores.get(d, 0.0) + s
+        if k is None:
+            return sorted(scores.items(), key=itemgetter(1), reverse=True)
+        return heapq.nlargest(k, scores.items(), key=itemgetter(1))
+
+
+# -----------------------------
+# SANS INDEX (blocs lus en flux, mode hors mémoire)
+# -----------------------------
+def _textes_normalises(textes):
+    # Termes de chaque texte (comme tokeniser) séparés et encadrés d'une espace : " t1 t2 " ;
+    # une seule normalisation par texte distinct ; code -1 (texte manquant) -> dernier élément, vide
+    codes, uniques = pd.factorize(textes)
+    norm = np.array([f" {normaliser_texte(t)} " for t in uniques] + ["  "], dtype=object)
+    return pd.Series(norm[codes], index=textes.index)
+
+def _contient(norm, termes):
+    # Textes normalisés contenant les termes consécutifs
+    return norm.str.contains(" " + " ".join(termes) + " ", regex=False).to_numpy(dtype=bool)
+
+def _masque(norm, mots, expressions):
+    # Même sélection qu'IndexTexte.chercher : toutes les expressions, sinon un mot-clé au moins
+    if expressions:
+        mask = np.ones(len(norm), dtype=bool)
+        for e in expressions:
+            mask &= _contient(norm, e)
+        return mask
+    mask = np.zeros(len(norm), dtype=bool)
+    for t in mots:
+        mask |= _contient(norm, [t])
+    return mask
+
+def masque_texte(textes, requete):
+    """Masque des textes (Series) qui répondent à la requête, par recherche de sous-chaînes (sans index)."""
+    return _masque(_textes_normalises(textes), *analyser(requete))
+
+def _classer(norm, mots, expressions, k):
+    # [(position, score)] des k meilleurs textes d'un bloc : même BM25 qu'IndexTexte.chercher,
+    # statistiques (n, idf, longueur moyenne) calculées sur le bloc
+    n = len(norm)
+    if n == 0 or (not mots and not expressions):
+        return []
+    longueurs = np.where(norm.str.len().to_numpy() > 2, norm.str.count(" ").to_numpy() - 1, 0)
+    moyenne = longueurs.sum() / n or 1.0
+    requis = _masque(norm, [], expressions) if expressions else None
+    scores = np.zeros(n)
+    for t in dict.fromkeys(mots + [t for e in expressions for t in e]):
+        presents = _contient(norm, [t])
+        nt = presents.sum()
+        if nt == 0:
+            continue
+        idf = math.log(1 + (n - nt + 0.5) / (nt + 0.5))
+        docs = np.flatnonzero(presents if requis is None else presents & requis)
+        tf = norm.iloc[docs].str.count(f"(?<= ){t}(?= )").to_numpy()
+        scores[docs] += idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * longueurs[docs] / moyenne))
+    docs = np.flatnonzero(scores > 0)
+    docs = docs[np.argsort(-scores[docs], kind="stable")[:k]]
+    return list(zip(docs.tolist(), scores[docs].tolist()))
+
+def meilleurs_blocs(blocs, requete, k=100, colonne="Commentaire"):
+    """Les `k` lignes les mieux classées d'une suite de blocs, avec leur Score.
+
+    Les fréquences des termes (idf) sont celles de chaque bloc : classement
+    approché, suffisant pour des blocs de plusieurs dizaines de milliers de lignes.
+    """
+    mots, expressions = analyser(requete)
+    meilleurs = []  # tas de (score, rang, ligne)
+    rang = 0
+    for bloc in blocs:
+        for d, score in _classer(_textes_normalises(bloc[colonne]), mots, expressions, k):
+            rang += 1
+            item = (score, rang, bloc.iloc[d])
+            if len(meilleurs) < k:
+                heapq.heappush(meilleurs, item)
+            elif score > meilleurs[0][0]:
+                heapq.heapreplace(meilleurs, item)
+    if not meilleurs:
+        return pd.DataFrame(columns=["Score", colonne])
+    meilleurs.sort(key=itemgetter(0), reverse=True)
+    out = pd.DataFrame([ligne for _, _, ligne in meilleurs]).reset_index(drop=True)
+    out.insert(0, "Score", [round(score, 2) for score, _, _ in meilleurs])
+    return out
@@ -0,0 +1,444 @@
+# syntheses.py
+# Synthèses matérialisées pour les tableaux de bord : statistiques d'état par
+# pont et par ville, statistiques des propriétés par matériau, nombre de votes
+# par avis et par zone. Elles sont recalculées à partir des données brutes par
+# une tâche (périodique et après chaque enregistrement) et écrites en Parquet dans
+# SYNTHESES_DIR ; les tableaux de bord ne lisent que ces fichiers, sauf pour
+# les filtres ad hoc (calcul en direct).
+#
+# Les synthèses des ponts s'additionnent bloc par bloc (AgregatPonts) : au-delà
+# de pont_donnees.SEUIL_HORS_MEMOIRE, elles sont calculées en flux sans charger
+# les évaluations en mémoire.
+#
+# Chaque passage ne recalcule que les groupes de tables dont la source a changé
+# (évaluations, matériaux, partition de chaque zone), d'après les versions
+# notées dans etat.json ; les nouvelles évaluations sont fusionnées dans les
+# sommes partielles du passage précédent.
+#
+#   python syntheses.py                  une matérialisation puis sortie
+#   python syntheses.py --intervalle 300 en continu (toutes les 5 min)
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from import_masse import PROPRIETES_MATERIAU
+from noms_materiaux import IndexMateriaux, normaliser_serie
+from zones import jeu_zone, lister_zones
+from pont_donnees import RATING_COLS, appliquer_schema, hors_memoire, lire_par_blocs, load_data
+from stockage import FENETRE_RELECTURE, JOURNAL_MAX, get_stockage, remplacement_atomique, verrou_fichier
+
+# -----------------------------
+# CONFIG
+# -----------------------------
+SYNTHESES_DIR = "syntheses"
+ETAT_FILE = "etat.json"  # horodatage de la dernière matérialisation + tables écrites
+INTERVALLE = 300  # secondes entre deux matérialisations périodiques
+
+# Segments démographiques des votes
+TRANCHES_AGE = [0, 25, 35, 50, 65, 200]
+LIBELLES_TRANCHES = ["< 25 ans", "25-34 ans", "35-49 ans", "50-64 ans", "65 ans et +"]
+NON_RENSEIGNE = "Non renseigné"
+
+
+# -----------------------------
+# CALCUL DES SYNTHÈSES (aussi utilisé en direct pour les filtres ad hoc)
+# -----------------------------
+def _texte(s):
+    return s.astype(object).where(s.notna(), "").astype(str).str.strip()
+
+# Agrégats partiels d'un bloc : sommes, effectifs, min / max, additionnables d'un bloc à l'autre
+_FUSION = {"n": "sum", "n_indice": "sum", "somme_indice": "sum", "Indice_min": "min", "Indice_max": "max",
+           **{f"somme_{c}": "sum" for c in RATING_COLS}, **{f"n_{c}": "sum" for c in RATING_COLS}}
+
+def _partiel(base, cles):
+    g = base.groupby(cles, sort=False, observed=True)
+    notes = g[RATING_COLS]
+    out = pd.concat([
+        g.size().rename("n"),
+        g["Indice_Etat"].count().rename("n_indice"),
+        g["Indice_Etat"].sum().rename("somme_indice"),
+        g["Indice_Etat"].min().rename("Indice_min"),
+        g["Indice_Etat"].max().rename("Indice_max"),
+        notes.sum().add_prefix("somme_"),
+        notes.count().add_prefix("n_"),
+    ], axis=1)
+    if "Timestamp" in base.columns:
+        out["Derniere_evaluation"] = g["Timestamp"].max()
+    return out
+
+def _fusionner(a, b):
+    if a is None:
+        return b
+    regles = {c: r for c, r in _FUSION.items() if c in a.columns}
+    if "Derniere_evaluation" in a.columns:
+        regles["Derniere_evaluation"] = "max"
+    return pd.concat([a, b]).groupby(level=list(range(a.index.nlevels)), sort=False).agg(regles)
+
+def _finaliser(partiel):
+    # Sommes -> moyennes ; mêmes colonnes que le calcul direct d'avant (moyennes + effectifs n_)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        out = pd.DataFrame({"n": partiel["n"]}, index=partiel.index)
+        out["Indice_moyen"] = (partiel["somme_indice"] / partiel["n_indice"]).astype("float32")
+        out["Indice_min"] = partiel["Indice_min"]
+        out["Indice_max"] = partiel["Indice_max"]
+        if "Derniere_evaluation" in partiel.columns:
+            out["Derniere_evaluation"] = partiel["Derniere_evaluation"]
+        for c in RATING_COLS:
+            out[c] = (partiel[f"somme_{c}"] / partiel[f"n_{c}"]).astype("float32")
+        for c in RATING_COLS:
+            out[f"n_{c}"] = partiel[f"n_{c}"]
+    return out.sort_index()
+
+
+class AgregatPonts:
+    """Synthèses des ponts calculées bloc par bloc (mémoire bornée par le nombre de ponts).
+
+    `ajouter()` accepte des blocs d'évaluations au SCHEMA ; `resultat()` renvoie
+    les mêmes tables que resumer_ponts() sur la concaténation des blocs.
+    """
+
+    def __init__(self):
+        self._pont = None
+        self._etats = None
+
+    def ajouter(self, df):
+        base = pd.DataFrame({
+            "Pont": _texte(df["Pont"]),
+            "Ville": _texte(df["Ville"]),
+            "Etat_tablier": _texte(df["Etat_tablier"]),
+            "Indice_Etat": df["Indice_Etat"].astype("float64"),
+            "Timestamp": df["Timestamp"],
+        })
+        base[RATING_COLS] = df[RATING_COLS].astype("float64")
+        self._pont = _fusionner(self._pont, _partiel(base, ["Pont", "Ville"]))
+        etats = base.groupby(["Ville", "Etat_tablier"], sort=False).size().rename("n").to_frame()
+        self._etats = etats if self._etats is None else \
+            pd.concat([self._etats, etats]).groupby(level=[0, 1], sort=False).sum()
+        return self
+
+    def resultat(self):
+        if self._pont is None:
+            return resumer_ponts(pd.DataFrame())
+        par_pont = _finaliser(self._pont).reset_index()
+        # les villes se déduisent des ponts : sommes par ville, sans repasser sur les blocs
+        ville = self._pont.groupby(level="Ville", sort=True).agg(_FUSION)
+        par_ville = _finaliser(ville)
+        par_ville.insert(4, "n_ponts", self._pont.groupby(level="Ville").size())
+        etats = self._etats.sort_index().reset_index()
+        return {"ponts_par_pont": par_pont, "ponts_par_ville": par_ville.reset_index(), "ponts_etats": etats}
+
+
+def resumer_ponts(df):
+    """{"ponts_par_pont", "ponts_par_ville", "ponts_etats"} à partir des évaluations."""
+    if df.empty:
+        vides = {
+            "ponts_par_pont": ["Pont", "Ville", "n", "Indice_moyen", "Indice_min", "Indice_max", "Derniere_evaluation"],
+            "ponts_par_ville": ["Ville", "n", "Indice_moyen", "Indice_min", "Indice_max", "n_ponts"],
+        }
+        tables = {nom: pd.DataFrame(columns=cols + RATING_COLS + [f"n_{c}" for c in RATING_COLS]) for nom, cols in vides.items()}
+        tables["ponts_etats"] = pd.DataFrame(columns=["Ville", "Etat_tablier", "n"])
+        return tables
+    return AgregatPonts().ajouter(df).resultat()
+
+def resumer_ponts_par_blocs(blocs):
+    """Comme resumer_ponts, sur des blocs lus en flux (voir pont_donnees.lire_par_blocs)."""
+    agregat = AgregatPonts()
+    for bloc in blocs:
+        agregat.ajouter(bloc)
+    return agregat.resultat()
+
+def resumer_materiaux(df):
+    """Moyenne / min / max de chaque propriété par matériau (variantes d'écriture regroupées)."""
+    if df.empty or "Materiau" not in df.columns:
+        return pd.DataFrame(columns=["Cle", "Materiau", "n"])
+    props = df.reindex(columns=PROPRIETES_MATERIAU).apply(pd.to_numeric, errors="coerce").astype("float32")
+    g = props.groupby(normaliser_serie(_texte(df["Materiau"])).rename("Cle"), sort=True)
+    out = g.agg(["mean", "min", "max"])
+    suffixes = {"mean": "moy", "min": "min", "max": "max"}
+    out.columns = [f"{c}_{suffixes[stat]}" for c, stat in out.columns]
+    out = g.size().rename("n").to_frame().join(out)
+    index = IndexMateriaux(df["Materiau"].dropna())
+    out.insert(0, "Materiau", out.index.map(index.canonique))
+    return out[out.index != ""].reset_index()
+
+def resumer_votes(df):
+    """Nombre de votes par avis."""
+    if df.empty or "Avis" not in df.columns:
+        return pd.DataFrame(columns=["Avis", "n"])
+    avis = _texte(df["Avis"])
+    # sans avis (ex. réponses matériaux du même classeur) : pas un vote
+    return avis[avis != ""].value_counts().rename_axis("Avis").rename("n").reset_index()
+
+
+def resumer_votes_segments(df):
+    """Votes par (sexe, tranche d'âge, avis) : base des parts par segment et de leurs intervalles."""
+    if df.empty or "Avis" not in df.columns:
+        return pd.DataFrame(columns=["Sexe", "Tranche_age", "Avis", "n"])
+    sexe = _texte(df["Sexe"]) if "Sexe" in df.columns else pd.Series("", index=df.index)
+    age = pd.to_numeric(df["Age"], errors="coerce") if "Age" in df.columns else pd.Series(np.nan, index=df.index)
+    tranche = pd.cut(age, TRANCHES_AGE, labels=LIBELLES_TRANCHES, right=False).astype(object)
+    seg = pd.DataFrame({
+        "Sexe": sexe.replace("", NON_RENSEIGNE),
+        "Tranche_age": tranche.where(tranche.notna(), NON_RENSEIGNE),
+        "Avis": _texte(df["Avis"]),
+    })
+    seg = seg[seg["Avis"] != ""]
+    return seg.groupby(["Sexe", "Tranche_age", "Avis"], sort=True).size().rename("n").reset_index()
+
+
+# -----------------------------
+# RECOMBINAISONS (à partir des synthèses, sans données brutes)
+# -----------------------------
+def moyennes_notes(par_ville, villes=None):
+    """Moyenne globale de chaque note (pondérée par les effectifs), éventuellement sur quelques villes."""
+    if villes is not None:
+        par_ville = par_ville[par_ville["Ville"].isin(villes)]
+    eff = par_ville[[f"n_{c}" for c in RATING_COLS]].to_numpy(dtype="float64")
+    moy = np.nan_to_num(par_ville[RATING_COLS].to_numpy(dtype="float64"))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return pd.Series((moy * eff).sum(axis=0) / eff.sum(axis=0), index=RATING_COLS)
+
+def cumul_zones(votes, zone=None, cles=("Avis",)):
+    """Votes d'une zone, ou de toutes les zones (zone=None) additionnés par `cles`."""
+    if zone is not None:
+        return votes[votes["Zone"] == zone].drop(columns="Zone")
+    return votes.groupby(list(cles), sort=True)["n"].sum().reset_index()
+
+def comptes_etats(etats, villes=None):
+    if villes is not None:
+        etats = etats[etats["Ville"].isin(villes)]
+    return etats.groupby("Etat_tablier")["n"].sum().sort_values(ascending=False)
+
+
+# -----------------------------
+# MATÉRIALISATION
+# -----------------------------
+TABLES_PONTS = ["ponts_par_pont", "ponts_par_ville", "ponts_etats"]
+
+
+class _SynthesePonts:
+    """Agrégat des ponts du processus, tenu à jour d'une matérialisation à l'autre.
+
+    Seules les évaluations ajoutées depuis le dernier passage sont lues et
+    fusionnées dans les sommes partielles (AgregatPonts) ; recalcul complet au
+    premier passage, après une réécriture du jeu ou une correction de notes.
+    """
+
+    def __init__(self):
+        self.stockage = None
+        self.agregat = None
+        self.curseur = None
+        # derniers IDs comptés : la fenêtre de relecture SQL renvoie des lignes déjà vues
+        self.vus = deque(maxlen=4 * FENETRE_RELECTURE)
+
+    def mettre_a_jour(self, stockage):
+        if stockage is not self.stockage:
+            self.stockage, self.agregat = stockage, None
+        if self.agregat is not None:
+            suite = stockage.evaluations_depuis(self.curseur)
+            if suite is not None:
+                nouvelles, corrections, curseur = suite
+                # une correction de commentaire ne change aucun agrégat
+                if not corrections["Champ"].isin(RATING_COLS + ["Indice_Etat"]).any():
+                    nouvelles = appliquer_schema(nouvelles)
+                    nouvelles = nouvelles[~nouvelles["ID"].isin(set(self.vus))]
+                    if len(nouvelles):
+                        self.agregat.ajouter(nouvelles)
+                        self.vus.extend(nouvelles["ID"])
+                    self.curseur = curseur
+                    return self.agregat.resultat()
+        # curseur lu avant les données : une ligne arrivée entre-temps est comptée une fois (voir vus)
+        self.curseur = stockage.curseur_evaluations()
+        self.agregat = AgregatPonts()
+        self.vus.clear()
+        blocs = lire_par_blocs(stockage) if hors_memoire(stockage) else [load_data(stockage)]
+        for bloc in blocs:
+            self.agregat.ajouter(bloc)
+            self.vus.extend(bloc["ID"])
+        return self.agregat.resultat()
+
+_ponts = _SynthesePonts()
+
+
+def calculer(stockage=None, precedent=None):
+    """(tables, sources, tables recalculées) : toutes les synthèses et la version de leurs sources.
+
+    `precedent` : (tables, sources) de la dernière matérialisation ; un groupe de
+    tables dont la source n'a pas changé est repris tel quel, sans relire les données.
+    """
+    stockage = stockage or get_stockage()
+    avant, sources_avant = precedent or ({}, {})
+    tables, sources, recalculees = {}, {}, set()
+
+    def a_jour(source, version, noms):
+        return sources_avant.get(source) == version and all(n in avant for n in noms)
+
+    sources["ponts"] = repr(stockage.curseur_evaluations())
+    if a_jour("ponts", sources["ponts"], TABLES_PONTS):
+        tables.update({n: avant[n] for n in TABLES_PONTS})
+    else:
+        tables.update(_ponts.mettre_a_jour(stockage))
+        sources["ponts"] = repr(_ponts.curseur)
+        recalculees.update(TABLES_PONTS)
+
+    sources["materiaux"] = repr(stockage.version_reponses("materiaux"))
+    if a_jour("materiaux", sources["materiaux"], ["materiaux"]):
+        tables["materiaux"] = avant["materiaux"]
+    else:
+        tables["materiaux"] = resumer_materiaux(stockage.lire_reponses("materiaux"))
+        recalculees.add("materiaux")
+
+    # une partition par zone, relue seulement si elle a changé ; la vue toutes
+    # zones somme ces agrégats (voir cumul_zones)
+    zones = lister_zones()
+    par_zone = a_jour("zones", repr(zones), ["votes_avis", "votes_segments"]) \
+        and all("Zone" in avant[n].columns for n in ("votes_avis", "votes_segments"))
+    sources["zones"] = repr(zones)
+    votes, segments = [], []
+    for zone in zones:
+        cle = f"zone:{zone}"
+        sources[cle] = repr(stockage.version_reponses(jeu_zone(zone)))
+        if par_zone and sources_avant.get(cle) == sources[cle]:
+            votes.append(avant["votes_avis"][avant["votes_avis"]["Zone"] == zone])
+            segments.append(avant["votes_segments"][avant["votes_segments"]["Zone"] == zone])
+        else:
+            avis = stockage.lire_reponses(jeu_zone(zone))
+            votes.append(resumer_votes(avis).assign(Zone=zone))
+            segments.append(resumer_votes_segments(avis).assign(Zone=zone))
+            recalculees.update(["votes_avis", "votes_segments"])
+    tables["votes_avis"] = pd.concat(votes, ignore_index=True)
+    tables["votes_segments"] = pd.concat(segments, ignore_index=True)
+    if not par_zone:
+        recalculees.update(["votes_avis", "votes_segments"])
+    return tables, sources, recalculees
+
+def _precedent(dossier):
+    # (tables, sources) de la dernière matérialisation, ou None
+    tables, _ = lire(dossier)
+    if tables is None:
+        return None
+    try:
+        with open(os.path.join(dossier, ETAT_FILE), "r", encoding="utf-8") as f:
+            return tables, json.load(f).get("sources", {})
+    except (OSError, ValueError):
+        return None
+
+def materialiser(stockage=None, dossier=SYNTHESES_DIR):
+    """Met à jour les synthèses (une table Parquet chacune, puis etat.json) ; seules les tables
+    dont la source a changé sont recalculées et réécrites."""
+    os.makedirs(dossier, exist_ok=True)
+    etat_path = os.path.join(dossier, ETAT_FILE)
+    with verrou_fichier(etat_path):
+        horodatage = pd.Timestamp.now()
+        tables, sources, recalculees = calculer(stockage, _precedent(dossier))
+        for nom in recalculees:
+            with remplacement_atomique(os.path.join(dossier, f"{nom}.parquet")) as tmp:
+                tables[nom].to_parquet(tmp, index=False)
+        # écrit en dernier : les lecteurs ne voient jamais un horodatage en avance sur les tables
+        with remplacement_atomique(etat_path) as tmp:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"horodatage": horodatage.isoformat(),
+                           "lignes": {nom: len(df) for nom, df in tables.items()},
+                           "sources": sources}, f, indent=2)
+    return horodatage
+
+def version(dossier=SYNTHESES_DIR):
+    # Change à chaque matérialisation : sert de clé de cache
+    try:
+        return os.stat(os.path.join(dossier, ETAT_FILE)).st_mtime_ns
+    except OSError:
+        return None
+
+def lire(dossier=SYNTHESES_DIR):
+    """(tables, horodatage) de la dernière matérialisation, ou (None, None) si absente / illisible."""
+    try:
+        with open(os.path.join(dossier, ETAT_FILE), "r", encoding="utf-8") as f:
+            etat = json.load(f)
+        tables = {nom: pd.read_parquet(os.path.join(dossier, f"{nom}.parquet")) for nom in etat["lignes"]}
+    except Exception:
+        return None, None
+    return tables, pd.Timestamp(etat["horodatage"])
+
+
+# -----------------------------
+# TÂCHE EN ARRIÈRE-PLAN (une par processus)
+# -----------------------------
+_demande = threading.Event()
+_verrou_tache = threading.Lock()
+_tache = None
+_arret = None  # Event d'arrêt de la tâche en cours (voir arreter)
+
+def _boucle(stockage, intervalle, dossier, arret):
+    while True:
+        # réveil à chaque enregistrement ou toutes les `intervalle` secondes
+        inactif = not _demande.wait(intervalle)
+        _demande.clear()
+        if arret.is_set():
+            return
+        try:
+            materialiser(stockage, dossier)
+            # intégration du journal des corrections quand il devient trop gros : après la
+            # synthèse (dont le curseur suit ainsi le compactage), et sans enregistrement
+            # depuis `intervalle` secondes, sauf journal démesuré
+            (stockage or get_stockage()).compacter_si_necessaire(JOURNAL_MAX if inactif else 4 * JOURNAL_MAX)
+        except Exception as e:
+            print(f"[syntheses] échec de la matérialisation : {e}", file=sys.stderr)
+
+def demarrer(stockage=None, intervalle=INTERVALLE, dossier=SYNTHESES_DIR):
+    """Lance la tâche de matérialisation du processus (sans effet si déjà lancée)."""
+    global _tache, _arret
+    with _verrou_tache:
+        if _tache is None or not _tache.is_alive():
+            if version(dossier) is None:
+                _demande.set()  # première synthèse dès le démarrage
+            _arret = threading.Event()
+            _tache = threading.Thread(target=_boucle, args=(stockage, intervalle, dossier, _arret),
+                                      name="syntheses", daemon=True)
+            _tache.start()
+    return _tache
+
+def arreter(timeout=None):
+    """Arrête la tâche du processus après sa passe en cours ; True si elle est terminée.
+
+    À appeler avant de changer de répertoire courant ou de supprimer les
+    données : la tâche travaille avec des chemins relatifs (banc de charge).
+    """
+    global _tache
+    with _verrou_tache:
+        tache, _tache = _tache, None
+        if tache is None:
+            return True
+        _arret.set()
+        _demande.set()
+    tache.join(timeout)
+    return not tache.is_alive()
+
+def demander_materialisation():
+    # Après un enregistrement : les demandes rapprochées sont regroupées en une seule
+    _demande.set()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Matérialise les synthèses des tableaux de bord.")
+    parser.add_argument("--intervalle", type=float, default=None, help="secondes entre deux passes (défaut : une seule passe)")
+    parser.add_argument("--dossier", default=SYNTHESES_DIR)
+    args = parser.parse_args(argv)
+    while True:
+        t0 = time.perf_counter()
+        horodatage = materialiser(dossier=args.dossier)
+        print(f"Synthèses au {horodatage:%Y-%m-%d %H:%M:%S} écrites dans {args.dossier} "
+              f"en {time.perf_counter() - t0:.1f} s")
+        if args.intervalle is None:
+            return 0
+        time.sleep(args.intervalle)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
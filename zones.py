@@ -0,0 +1,36 @@
+# zones.py
+# Zones (campagnes) du sondage d'avis : chaque zone a sa propre partition de
+# réponses dans le stockage (un classeur par zone pour le backend fichiers, une
+# valeur de `jeu` pour les backends SQL). Contrôle du vote, comptes et
+# graphiques ne lisent que la partition de la zone ; la vue « toutes zones »
+# additionne des agrégats par partition.
+#
+# Les zones actives sont listées dans zones.json :
+#   {"zones": ["Ngoulemakong", "Ebolowa", "Sangmélima"]}
+import json
+import re
+
+from noms_materiaux import normaliser
+
+ZONES_FILE = "zones.json"
+# Campagne historique : ses réponses restent dans la partition "avis" (resultats.xlsx)
+ZONE_DEFAUT = "Ngoulemakong"
+JEU_AVIS = "avis"
+
+
+def lister_zones(path=ZONES_FILE):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            zones = [str(z).strip() for z in json.load(f).get("zones", []) if str(z).strip()]
+    except (OSError, ValueError):
+        zones = []
+    return zones or [ZONE_DEFAUT]
+
+def slug(zone):
+    return re.sub(r"[^a-z0-9]+", "-", normaliser(zone)).strip("-")
+
+def jeu_zone(zone):
+    """Nom de la partition (jeu de réponses) d'une zone."""
+    if zone is None or slug(zone) == slug(ZONE_DEFAUT):
+        return JEU_AVIS
+    return f"{JEU_AVIS}_{slug(zone)}"